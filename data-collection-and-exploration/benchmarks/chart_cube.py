@@ -0,0 +1,38 @@
+# compares getting the day-by-day rank trajectories of a few hundred tracks in all regions from the chart cube and with a pandas pivot of the charts
+# run from the data-collection-and-exploration folder: python benchmarks/chart_cube.py
+import resource
+import time
+from helpers import get_charts
+from helpers.cube import get_chart_cube
+
+N_TRACKS = 500
+
+
+def get_max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # MiB (on Linux)
+
+
+cube = get_chart_cube()
+track_ids = cube.tracks.to_series().sample(
+    min(N_TRACKS, len(cube.tracks)), random_state=0
+)
+
+rss_before = get_max_rss()
+start = time.perf_counter()
+trajectories = cube.get_trajectories(track_ids)
+cube_time = time.perf_counter() - start
+print(
+    f"cube: {len(trajectories)} tracks in {cube_time * 1000:.1f}ms,",
+    f"max. RSS +{get_max_rss() - rss_before:.1f} MiB",
+)
+
+charts = get_charts()
+start = time.perf_counter()
+selected = charts[charts.id.isin(track_ids)]
+pivots = {
+    track_id: track_charts.pivot_table(
+        index="region", columns="date", values="rank", observed=True
+    ).reindex(columns=cube.dates)
+    for track_id, track_charts in selected.groupby("id")
+}
+print(f"pandas pivots: {len(pivots)} tracks in {time.perf_counter() - start:.2f}s")
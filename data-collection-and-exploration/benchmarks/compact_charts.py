@@ -0,0 +1,23 @@
+# compares memory usage and groupby/deduplication speed of the regular and the compact (dictionary-encoded) chart tables
+# run from the data-collection-and-exploration folder: python benchmarks/compact_charts.py
+import time
+from helpers import get_countries_charts
+
+
+def time_it(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+for compact in [False, True]:
+    charts = get_countries_charts(compact=compact)
+    memory = charts.memory_usage(deep=True).sum() / 1024**2
+    groupby_time = time_it(
+        lambda: charts.groupby(["id", "country"], observed=True).streams.sum()
+    )
+    dedup_time = time_it(lambda: charts.drop_duplicates(subset=["id", "geo_region"]))
+    print(
+        f"compact={compact}: {memory:.1f} MiB,",
+        f"groupby {groupby_time:.2f}s, drop_duplicates {dedup_time:.2f}s",
+    )
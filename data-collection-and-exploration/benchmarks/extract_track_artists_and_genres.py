@@ -0,0 +1,80 @@
+# compares the vectorized helpers.tracks.extract_track_artists_and_genres with the row-by-row implementation
+# extract_track_artists_and_genres.py used before (copied below) on tracks.csv and artist_data.csv
+# run from the data-collection-and-exploration folder: python benchmarks/extract_track_artists_and_genres.py
+import time
+import pandas as pd
+from helpers import get_data_path
+from helpers.nested import read_csv_with_nested_columns
+from helpers.tracks import extract_track_artists_and_genres
+
+
+def legacy_extract_track_artists_and_genres(track, artist_data, max_artists=3):
+    artists = get_artist_names_and_ids_df(track.artists[:max_artists])
+    track_genres = get_unique_genres(artists.index, artist_data)
+    artists = artists.reset_index().set_index("rank")
+    res = {"track_id": track["id"]}
+    for rank, artist in artists.iterrows():
+        rank = str(rank)
+        res["artist_id_" + rank] = artist.id
+        res["artist_name_" + rank] = artist["name"]
+    res["genres"] = track_genres
+    return res
+
+
+def get_artist_names_and_ids_df(artist_objs):
+    relevant_artist_fields = ["id", "name"]
+    artists = pd.DataFrame(
+        [
+            {k: v for k, v in artist.items() if k in relevant_artist_fields}
+            for artist in artist_objs
+        ]
+    )
+    artists["rank"] = artists.index + 1
+    artists.set_index("id", inplace=True)
+    return artists
+
+
+def get_unique_genres(artist_ids, artist_data):
+    genres = []
+    for artist_genres in artist_data.loc[artist_ids].genres:
+        genres.extend(artist_genres)
+    return list(dict.fromkeys(genres))
+
+
+def run_legacy(tracks, artist_data):
+    return (
+        tracks.apply(
+            legacy_extract_track_artists_and_genres,
+            axis=1,
+            result_type="expand",
+            artist_data=artist_data,
+        )
+        .set_index("track_id")
+        .sort_index(axis=1)
+    )
+
+
+if __name__ == "__main__":
+    tracks = read_csv_with_nested_columns(
+        get_data_path("tracks.csv"), nested_columns=["artists"]
+    )
+    artist_data = read_csv_with_nested_columns(
+        get_data_path("artist_data.csv"), nested_columns=["genres"], index_col="id"
+    )
+
+    start = time.perf_counter()
+    legacy_result = run_legacy(tracks, artist_data)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = extract_track_artists_and_genres(tracks, artist_data)
+    vectorized_time = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(
+        result, legacy_result, check_dtype=False, check_index_type=False
+    )
+    print(f"{len(tracks)} tracks, identical output")
+    print(f"row-by-row: {legacy_time:.2f} s")
+    print(
+        f"vectorized: {vectorized_time:.2f} s ({legacy_time / vectorized_time:.0f}x faster)"
+    )
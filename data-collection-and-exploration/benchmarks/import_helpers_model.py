@@ -0,0 +1,42 @@
+# measures how long `import helpers.model` takes in a fresh interpreter
+# (helpers.model used to load and merge the full chart data at import time, which took several seconds)
+# run from the data-collection-and-exploration folder: python benchmarks/import_helpers_model.py
+import statistics
+import subprocess
+import sys
+
+RUNS = 10
+
+# helpers itself pulls in pandas, pyarrow etc., so we measure the import of helpers.model on top of that separately
+snippet = """
+import time
+start = time.perf_counter()
+import helpers
+helpers_done = time.perf_counter()
+import helpers.model
+model_done = time.perf_counter()
+assert "countries_charts" not in vars(helpers.model), "chart data was loaded at import time!"
+print(helpers_done - start, model_done - helpers_done)
+"""
+
+
+def measure():
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], capture_output=True, text=True, check=True
+    ).stdout
+    helpers_time, model_time = (float(t) for t in out.split())
+    return helpers_time, model_time
+
+
+if __name__ == "__main__":
+    results = [measure() for _ in range(RUNS)]
+    helpers_times = [r[0] * 1000 for r in results]
+    model_times = [r[1] * 1000 for r in results]
+    print(
+        f"import helpers (incl. pandas/pyarrow): {statistics.median(helpers_times):.1f} ms",
+        f"(median of {RUNS} runs)",
+    )
+    print(
+        f"import helpers.model on top of that: {statistics.median(model_times):.2f} ms",
+        f"(median of {RUNS} runs)",
+    )
@@ -0,0 +1,37 @@
+# compares parsing nested columns of tracks.csv and artist_data.csv cell by cell with ast.literal_eval (as before)
+# with helpers.nested.parse_nested_column, both for the old Python repr format and for JSON
+# run from the data-collection-and-exploration folder: python benchmarks/parse_nested_columns.py
+import time
+from ast import literal_eval
+import pandas as pd
+from helpers import get_data_path
+from helpers.nested import parse_nested_column, encode_nested_columns
+
+
+def time_it(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+columns = {"tracks.csv": ["artists", "album"], "artist_data.csv": ["genres", "images"]}
+
+for file_name, nested_columns in columns.items():
+    raw = pd.read_csv(get_data_path(file_name), usecols=nested_columns)
+    # JSON version of the same data, as written by the crawlers now
+    as_json = encode_nested_columns(
+        pd.DataFrame({col: raw[col].map(literal_eval) for col in nested_columns})
+    )
+    for col in nested_columns:
+        expected, literal_eval_time = time_it(
+            lambda values: values.map(literal_eval), raw[col]
+        )
+        from_repr, repr_time = time_it(parse_nested_column, raw[col])
+        from_json, json_time = time_it(parse_nested_column, as_json[col])
+        assert from_repr.tolist() == expected.tolist()
+        assert from_json.tolist() == expected.tolist()
+        print(
+            f"{file_name} {col} ({len(raw)} rows):",
+            f"literal_eval {literal_eval_time:.2f}s,",
+            f"parse_nested_column {repr_time:.2f}s (repr) / {json_time:.2f}s (JSON)",
+        )
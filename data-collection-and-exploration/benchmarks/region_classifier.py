@@ -0,0 +1,34 @@
+# measures the latency of single-track predictions of the KNN region classifiers (through a MicroBatcher) and the time it takes to score all tracks
+# run from the data-collection-and-exploration folder: python benchmarks/region_classifier.py
+import time
+from helpers.model import get_basic_track_features
+from helpers.region_classifier import (
+    MicroBatcher,
+    load_region_classifier,
+    predict_track_regions,
+)
+
+N_QUERIES = 2000
+
+track_feats = get_basic_track_features()
+
+for model_name in ["best_std_knn", "best_pca_knn"]:
+    start = time.perf_counter()
+    classifier = load_region_classifier(model_name)
+    print(
+        f"{model_name}: loaded in {(time.perf_counter() - start) * 1000:.1f}ms ({classifier.algorithm})"
+    )
+
+    X = classifier.get_features(
+        track_feats.sample(min(N_QUERIES, len(track_feats)), random_state=0)
+    )
+    with MicroBatcher(classifier) as batcher:
+        for row in X:
+            batcher.predict_proba(row)
+    print(f"{model_name}: single tracks: {batcher.stats}")
+
+    start = time.perf_counter()
+    predictions = predict_track_regions(model_name)
+    print(
+        f"{model_name}: scored {len(predictions)} tracks in {time.perf_counter() - start:.2f}s"
+    )
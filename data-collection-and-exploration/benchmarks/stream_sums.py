@@ -0,0 +1,38 @@
+# compares the top 50 tracks by streams over a date window from the stream prefix sums and with a pandas groupby over the charts
+# run from the data-collection-and-exploration folder: python benchmarks/stream_sums.py
+import time
+from helpers import get_charts
+from helpers.stream_sums import get_stream_sums
+
+N_WINDOWS = 20
+
+sums = get_stream_sums()
+dates = sums.cube.dates
+windows = [
+    (dates[i], dates[min(i + 30, len(dates) - 1)])
+    for i in range(0, len(dates), max(1, len(dates) // N_WINDOWS))
+][:N_WINDOWS]
+
+start = time.perf_counter()
+top_sums = [
+    sums.get_top_tracks(50, window_start, window_end)
+    for window_start, window_end in windows
+]
+sums_time = (time.perf_counter() - start) / len(windows)
+print(f"prefix sums: {sums_time * 1000:.1f}ms per window")
+
+charts = get_charts()
+start = time.perf_counter()
+top_pandas = [
+    charts[charts.date.between(window_start, window_end)]
+    .groupby("id", observed=True)
+    .streams.sum()
+    .nlargest(50)
+    for window_start, window_end in windows
+]
+pandas_time = (time.perf_counter() - start) / len(windows)
+print(f"pandas groupby: {pandas_time * 1000:.1f}ms per window")
+print(
+    "same top tracks:",
+    all(set(a.index) == set(b.index.astype(str)) for a, b in zip(top_sums, top_pandas)),
+)
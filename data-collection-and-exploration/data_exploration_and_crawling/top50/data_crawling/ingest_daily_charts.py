@@ -0,0 +1,41 @@
+# this script adds new daily chart CSVs (downloaded to scraped_chart_data, see scrape_missing_dec_2021.py) to top50.csv
+# and fetches the metadata only for the tracks and artists that have not been seen before
+# %%
+from dotenv import load_dotenv
+from helpers import get_data_path
+from helpers.checkpoint import CheckpointStore
+from helpers.ingest import (
+    get_region_code_to_name,
+    get_unseen_ids,
+    ingest_scraped_chart_files,
+)
+from helpers.spotify_api import fetch_into_store
+
+load_dotenv()
+
+# %%
+# only files for (region, date) pairs that are not in top50.csv yet are read (in parallel, using all cores) and appended
+new_rows = ingest_scraped_chart_files(
+    get_data_path("scraped_chart_data"), get_region_code_to_name()
+)
+
+# %%
+# the same stores are used by fetch_tracks.py, fetch_audio_features.py and fetch_artist_data.py
+track_store = CheckpointStore("tracks")
+new_track_ids = get_unseen_ids(new_rows.id, track_store)
+print(f"{len(new_track_ids)} new tracks")
+fetch_into_store(track_store, "tracks", new_track_ids)
+fetch_into_store(CheckpointStore("audio_features"), "audio-features", new_track_ids)
+
+# %%
+new_tracks = track_store.values(keys=new_track_ids)
+artist_store = CheckpointStore("artists")
+new_artist_ids = get_unseen_ids(
+    [artist["id"] for track in new_tracks if track for artist in track["artists"]],
+    artist_store,
+)
+print(f"{len(new_artist_ids)} new artists")
+fetch_into_store(artist_store, "artists", new_artist_ids)
+print("done")
+
+# %%
@@ -1,94 +1,93 @@
 # %%
 import pandas as pd
-from lyricsgenius import Genius
 from dotenv import load_dotenv
+import json
 import os
 import sys
-import time
-from pandarallel import pandarallel
-from helpers import get_data_path, create_data_out_path, split_dataframe
-import logging
+from helpers import get_data_path, create_data_out_path
+from helpers.checkpoint import CheckpointStore, CHECKPOINT_DIR
+from helpers.genius import fetch_genius_songs, get_song_key, GENIUS_CACHE_NAME
+from pathlib import Path
 
 load_dotenv()  # loads GENIUS_ACCESS_TOKEN environment variable from .env, if it is present
-token = os.getenv("GENIUS_ACCESS_TOKEN")
 
-if token is None:
+if os.getenv("GENIUS_ACCESS_TOKEN") is None:
     print(
         "no Genius API token found! Generate it from https://genius.com/api-clients and place it .env file of current directory under GENIUS_ACCESS_TOKEN key"
     )
     sys.exit()
 
-pandarallel.initialize(
-    progress_bar=True
-)  # pandarallel should speed up processing a bit, hopefully
-
 tracks_and_primary_artist = pd.read_csv(
     get_data_path("track_and_primary_artist_names.csv")
 )
 
 # %%
-chunks = split_dataframe(tracks_and_primary_artist, chunk_size=100)
-
-genius = Genius(token)
-genius.verbose = False  # Turn off status messages
-genius.remove_section_headers = True  # Remove section headers (e.g. [Chorus])
-
-
-def get_lyrics(row):
-    while True:
-        try:
-            # this try...except is a workaround for request timeout issues; we just retry the song search until it works
-            if type(row.title) is not str:
-                print("title is", row.title, "skipping...")
-                break
-            result = genius.search_song(row.title, row.artist, get_full_info=True)
-            if result is not None:
-                data = result.to_dict()
-                data["spotify_tid"] = row.track_id
-                return pd.Series(
-                    data
-                ).sort_index()  # not sure if sorting is really necessary, but at least JSON props always have same order than probably?
-            else:
-                print(" No result found for", row.title, "by", row.artist)
-                return pd.Series({"spotify_tid": row.track_id})
-            break
-        except:
-            pass  # not interested in error, just try again lol
-
-
-lyric_chunks_folder_path = create_data_out_path("genius_data_chunks")
-if not os.path.exists(lyric_chunks_folder_path):
-    os.mkdir(lyric_chunks_folder_path)
-
-processed_chunks = [None] * len(chunks)
-
-for i, chunk in enumerate(chunks):
-    chunk_path = os.path.join(
-        lyric_chunks_folder_path,
-        f"{chunk.index[0]}-{chunk.index[-1]}.json",
+# the first version of this script wrote its results to JSON files with 100 tracks each - move them to the (title, artist) cache once
+legacy_chunk_folder_path = Path(create_data_out_path("genius_data_chunks"))
+store = CheckpointStore(GENIUS_CACHE_NAME)
+if len(store) == 0 and legacy_chunk_folder_path.exists():
+    songs_by_track_id = (
+        tracks_and_primary_artist.assign(
+            track_id=tracks_and_primary_artist.track_id.astype(str)
+        )
+        .drop_duplicates("track_id")
+        .set_index("track_id")
     )
-    print(
-        f"processing chunk {i+1} of {len(chunks)} (rows {chunk.index[0]}-{chunk.index[-1]})"
+    legacy_results = {}
+    for path in legacy_chunk_folder_path.glob("*.json"):
+        with open(path) as f:
+            chunk = json.load(f)
+        for result in chunk.values():
+            track_id = str(result.pop("spotify_tid", None))
+            # rows of tracks without title don't even have the track ID
+            if track_id not in songs_by_track_id.index:
+                continue
+            song = songs_by_track_id.loc[track_id]
+            # rows without lyrics only have the track ID, i.e. Genius had no match (the other columns are null)
+            legacy_results[get_song_key(song.title, song.artist)] = (
+                {k: v for k, v in result.items() if v is not None}
+                if result.get("lyrics") is not None
+                else None
+            )
+    store.add(legacy_results.keys(), legacy_results.values())
+    print(f"moved {len(legacy_results)} results from the old chunk files")
+store.close()
+
+# %%
+# results of older versions of this script were checkpointed by track ID - move them to the (title, artist) cache so they aren't searched again
+if os.path.exists(os.path.join(CHECKPOINT_DIR, "genius_track_data.sqlite")):
+    old_store = CheckpointStore("genius_track_data")
+    store = CheckpointStore(GENIUS_CACHE_NAME)
+    old_tracks = tracks_and_primary_artist[
+        tracks_and_primary_artist.track_id.astype(str).isin(old_store.keys)
+    ]
+    old_results = old_store.values(old_tracks.track_id.astype(str))
+    store.add(
+        [get_song_key(row.title, row.artist) for row in old_tracks.itertuples()],
+        # rows without lyrics only have the track ID, i.e. Genius had no match
+        [
+            (
+                {k: v for k, v in result.items() if k != "spotify_tid"}
+                if result.get("lyrics") is not None
+                else None
+            )
+            for result in old_results
+        ],
     )
-    start_time = time.time()
+    print(f"moved {len(old_results)} results from the old checkpoint")
+    store.close()
+    old_store.close()
+
+# %%
+# songs are searched concurrently (see helpers.genius); results - including songs Genius has no match for - are cached in data/checkpoints,
+# so the crawl can be interrupted anytime and re-running it only searches songs that weren't searched before (or failed)
+genius_data = fetch_genius_songs(
+    tracks_and_primary_artist[["track_id", "title", "artist"]],
+    max_concurrency=8,
+    requests_per_second=5,
+).rename(columns={"track_id": "spotify_tid"})
 
-    if os.path.exists(chunk_path):
-        print("chunk already exists, loading into memory")
-        chunk_data = pd.read_json(chunk_path, orient="index")
-    else:
-        chunk_data = chunk.parallel_apply(
-            get_lyrics, axis=1, result_type="expand"
-        )  # using pandarallel speeds things up significantly :)
-        chunk_data.set_index("spotify_tid")
-        chunk_data.to_json(
-            chunk_path,
-            orient="index",
-        )
-    processed_chunks[i] = chunk_data
-    print("processed chunk in " + f"{(time.time() - start_time):.2f}" + " seconds")
 #%%
-print("combining chunk data")
-genius_data = pd.concat(processed_chunks)
 genius_data = genius_data.loc[genius_data.lyrics.notna()]
 print("obtained Genius data for", len(genius_data), "songs")
 genius_data.to_json(
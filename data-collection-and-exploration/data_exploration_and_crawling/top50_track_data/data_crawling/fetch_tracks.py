@@ -1,52 +1,52 @@
 # %%
 import pandas as pd
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
-from helpers import get_data_path, create_data_out_path, split_dataframe
-import os
+from helpers import get_charts, create_data_out_path
+from helpers.checkpoint import CheckpointStore
+from helpers.nested import encode_nested_columns, parse_nested_column
+from helpers.spotify_api import fetch_into_store
+from pathlib import Path
 
 load_dotenv()
-scope = "user-library-read"
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=scope))
 
 #%%
-charts = pd.read_csv(
-    get_data_path("top50.csv"),
-    parse_dates=["date"],
-    dtype={"region": "category"},
-)
+charts = get_charts()
 # %%
-track_uris = charts.uri.drop_duplicates().reset_index()
+track_ids = charts.id.drop_duplicates().tolist()
 
 # %%
-chunks = split_dataframe(track_uris, chunk_size=50)
-chunk_folder_path = create_data_out_path("track_chunks")
-
-
-def fetch_track_infos(chunk):
-    chunk_name = f"{chunk.index.min()}-{chunk.index.max()}.csv"
-    print("current chunk:", chunk_name)
-    out_path = os.path.join(chunk_folder_path, chunk_name)
-
-    if not os.path.exists(out_path):
-        api_resp = sp.tracks(chunk.uri)["tracks"]
-        chunk_data = pd.DataFrame(api_resp)
-        chunk_data.index = chunk.index
-        chunk_data.to_csv(out_path, index=False)
-        return chunk_data
-    else:
-        print("Chunk already exists, loading")
-        chunk_data = pd.read_csv(out_path)
-        return chunk_data
+# fetched tracks are checkpointed in a single store - re-running the script only fetches tracks that are missing from it
+store = CheckpointStore("tracks")
+
+# results of older versions of this script (CSVs with 50 tracks each, nested objects written as Python reprs) are moved into the store once
+legacy_nested_columns = {
+    "album",
+    "artists",
+    "available_markets",
+    "external_ids",
+    "external_urls",
+}
+legacy_chunk_folder_path = Path(create_data_out_path("track_chunks"))
+if len(store) == 0 and legacy_chunk_folder_path.exists():
+    legacy_chunks = [
+        pd.read_csv(path) for path in legacy_chunk_folder_path.glob("*.csv")
+    ]
+    if legacy_chunks:
+        legacy_tracks = pd.concat(legacy_chunks).drop_duplicates(subset="id")
+        for col in legacy_nested_columns.intersection(legacy_tracks.columns):
+            legacy_tracks[col] = parse_nested_column(legacy_tracks[col])
+        store.add_frame(legacy_tracks, key_column="id")
 
-
-track_infos = [fetch_track_infos(chunk) for chunk in chunks]
+# %%
+fetch_into_store(store, "tracks", track_ids)
 print("done fetching data")
 
 # %%
-track_data = pd.concat(track_infos)
+track_data = store.to_frame(keys=track_ids)
 # %%
-track_data.to_csv(create_data_out_path("tracks.csv"), index=False)
+# nested objects (album, artists etc.) are stored as JSON
+encode_nested_columns(track_data).to_csv(
+    create_data_out_path("tracks.csv"), index=False
+)
 
 # %%
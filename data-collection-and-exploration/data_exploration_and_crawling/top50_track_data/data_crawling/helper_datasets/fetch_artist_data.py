@@ -1,44 +1,42 @@
 # %%
 import pandas as pd
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
-from helpers import get_data_path, create_data_out_path, split_dataframe
-import os
+from helpers import get_data_path, create_data_out_path
+from helpers.checkpoint import CheckpointStore
+from helpers.nested import encode_nested_columns, parse_nested_column
+from helpers.spotify_api import fetch_into_store
+from pathlib import Path
 
 load_dotenv()
-scope = "user-library-read"
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=scope))
 
 #%%
 track_artists = pd.read_csv(get_data_path("track_artists.csv"))
 artist_ids = track_artists.artist_id.drop_duplicates().reset_index()
 artist_ids.to_csv(create_data_out_path("artists.csv"), index=False)
 # %%
-chunks = split_dataframe(pd.DataFrame(artist_ids), chunk_size=50)
-chunk_folder_path = create_data_out_path("artist_info_chunks")
-# %%
-def fetch_artist_infos(chunk):
-    chunk_name = f"{chunk.index.min()}-{chunk.index.max()}.csv"
-    print("current chunk:", chunk_name)
-    out_path = os.path.join(chunk_folder_path, chunk_name)
-
-    if not os.path.exists(out_path):
-        api_resp = sp.artists(chunk.artist_id)["artists"]
-        chunk_data = pd.DataFrame(api_resp)
-        chunk_data.index = chunk.index
-        chunk_data.to_csv(out_path, index=False)
-        return chunk_data
-    else:
-        print("Chunk already exists, loading")
-        chunk_data = pd.read_csv(out_path)
-        return chunk_data
+store = CheckpointStore("artists")
 
+# results of older versions of this script (CSVs with 50 artists each, nested objects written as Python reprs) are moved into the store once
+legacy_nested_columns = {"external_urls", "followers", "genres", "images"}
+legacy_chunk_folder_path = Path(create_data_out_path("artist_info_chunks"))
+if len(store) == 0 and legacy_chunk_folder_path.exists():
+    legacy_chunks = [
+        pd.read_csv(path) for path in legacy_chunk_folder_path.glob("*.csv")
+    ]
+    if legacy_chunks:
+        legacy_artists = pd.concat(legacy_chunks).drop_duplicates(subset="id")
+        for col in legacy_nested_columns.intersection(legacy_artists.columns):
+            legacy_artists[col] = parse_nested_column(legacy_artists[col])
+        store.add_frame(legacy_artists, key_column="id")
 
-artist_infos = [fetch_artist_infos(chunk) for chunk in chunks]
+# %%
+fetch_into_store(store, "artists", artist_ids.artist_id)
 print("done fetching data")
 
 # %%
-artist_data = pd.concat(artist_infos)
+artist_data = store.to_frame(keys=artist_ids.artist_id)
 # %%
-artist_data.to_csv(create_data_out_path("artist_data.csv"), index=False)
+# nested objects (genres, images etc.) are stored as JSON
+encode_nested_columns(artist_data).to_csv(
+    create_data_out_path("artist_data.csv"), index=False
+)
@@ -0,0 +1,11 @@
+# %%
+# serves predictions of the KNN region classifiers trained in knn_region_classification.ipynb over HTTP (see helpers.region_classifier), e.g.
+# curl -X POST localhost:8000/predict -d '{"ids": ["<Spotify track ID>"]}'
+# curl localhost:8000/stats  (number of requests and p50/p99 latency)
+from helpers.model import get_basic_track_features
+from helpers.region_classifier import serve_region_classifier
+
+MODEL_NAME = "best_std_knn"  # or best_pca_knn
+PORT = 8000
+
+serve_region_classifier(MODEL_NAME, track_feats=get_basic_track_features(), port=PORT)
@@ -1,8 +1,16 @@
-# fetches all the relevant data for the project that was uploaded to a public Google Drive folder
+# fetches all the relevant data for the project
+# if there is a data manifest (see helpers.fetch), the files listed there are downloaded in parallel (resuming interrupted downloads and verifying checksums)
+# otherwise, everything is fetched from the public Google Drive folder
 from helpers import DATA_DIR
-import gdown
+from helpers.fetch import load_data_manifest, fetch_data_files
 
-gdown.download_folder(
-    "https://drive.google.com/drive/folders/1bW2Gh3Xrcj6Dnaooe12JyCgYtmLh7Zt5?usp=sharing",
-    output=DATA_DIR,
-)
+manifest = load_data_manifest()
+if manifest:
+    fetch_data_files(manifest=manifest)
+else:
+    import gdown
+
+    gdown.download_folder(
+        "https://drive.google.com/drive/folders/1bW2Gh3Xrcj6Dnaooe12JyCgYtmLh7Zt5?usp=sharing",
+        output=DATA_DIR,
+    )
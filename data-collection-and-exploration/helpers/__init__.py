@@ -1,78 +1,145 @@
-import urllib.request
 from tqdm import tqdm
-from io import BytesIO
 from zipfile import ZipFile
+import shutil
+import tempfile
 import requests
 import os
 from pathlib import Path
 import pandas as pd
-from ast import literal_eval
-from functools import cache
+from functools import cache, wraps
+import hashlib
+import inspect
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .nested import parse_nested_column
 
 ROOT_DIR = Path(os.path.abspath(__file__)).parent.parent
 
 DATA_DIR = os.path.join(ROOT_DIR, "data")
 
+# typed columnar copies of the CSVs in DATA_DIR (and other derived data) live here
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
 
-class DownloadProgressBar(tqdm):
-    def update_to(self, b=1, bsize=1, tsize=None):
-        if tsize is not None:
-            self.total = tsize
-        self.update(b * bsize - self.n)
+# results of functions decorated with disk_cache are stored here
+MEMO_DIR = os.path.join(CACHE_DIR, "memo")
+# once the files in MEMO_DIR take up more space than this, the least recently used ones are deleted
+MEMO_DIR_SIZE_LIMIT = 4 * 1024**3  # bytes
 
+# downloaded ZIPs are written and extracted in chunks of this size
+ZIP_CHUNK_SIZE = 1024**2  # bytes
 
-def download(url, output_path=None):
-    with DownloadProgressBar(
-        unit="B", unit_scale=True, miniters=1, desc=url.split("/")[-1]
-    ) as t:
-        urllib.request.urlretrieve(url, filename=output_path, reporthook=t.update_to)
 
+def copy_to_file_atomically(src, target_path, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    Copies the file object src to target_path in chunks, via a temporary .part file (so target_path never contains partial data).
+    """
+    part_path = f"{target_path}.part"
+    with open(part_path, "wb") as out:
+        shutil.copyfileobj(src, out, chunk_size)
+    os.replace(part_path, target_path)
+
+
+def get_member_target_path(target_dir, member: str):
+    # don't let (malicious) member names like '../../x' write outside of target_dir ("zip slip")
+    target_dir = os.path.abspath(target_dir)
+    member_path = os.path.abspath(os.path.join(target_dir, member))
+    if os.path.commonpath([target_dir, member_path]) != target_dir:
+        raise RuntimeError(
+            f"ZIP member '{member}' would be extracted outside of '{target_dir}'"
+        )
+    return member_path
+
+
+def download_and_extract_zip(
+    url, target_path, members=None, sha256: str = None, chunk_size=ZIP_CHUNK_SIZE
+):
+    """
+    Downloads the ZIP file at url and extracts it, streaming everything in chunks (the ZIP is spooled to a temporary file, members are copied straight to disk), so memory usage doesn't depend on the size of the archive.
 
-def download_and_extract_zip(url, target_path):
-    with requests.get(url, stream=True) as resp:
+    If members is None, the first member of the ZIP is extracted to target_path. Otherwise, the given members (or all of them, if members is "all") are extracted into the directory target_path.
+
+    If sha256 is given, the checksum of the downloaded ZIP is checked before anything is extracted.
+    """
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(target_dir, exist_ok=True)
+    checksum = hashlib.sha256()
+    with requests.get(url, stream=True) as resp, tempfile.TemporaryFile(
+        dir=target_dir
+    ) as buffer:
+        resp.raise_for_status()
         message = f"Downloading ZIP from {url}"
         total = int(resp.headers.get("content-length", 0))
-        # Can also replace 'file' with a io.BytesIO object
-        with BytesIO() as buffer, tqdm(
+        with tqdm(
             desc=message,
             total=total,
             unit="iB",
             unit_scale=True,
             unit_divisor=1024,
         ) as bar:
-            for data in resp.iter_content(chunk_size=1024):
+            for data in resp.iter_content(chunk_size=chunk_size):
+                checksum.update(data)
                 size = buffer.write(data)
                 bar.update(size)
-            zip_file = ZipFile(buffer)
-            with zip_file.open(zip_file.namelist()[0]) as f:
-                content = f.read().decode()
-                with open(target_path, "w") as out:
-                    print(f"extracting to '{target_path}'")
-                    out.write(content)
-
-
-def download_data(url: str, name: str, unzip=False):
+        if sha256 is not None and checksum.hexdigest() != sha256.lower():
+            raise RuntimeError(
+                f"Checksum mismatch for ZIP from {url}: expected {sha256}, got {checksum.hexdigest()}"
+            )
+        buffer.seek(0)
+        with ZipFile(buffer) as zip_file:
+            if members is None:
+                member_paths = {zip_file.namelist()[0]: target_path}
+            else:
+                if members == "all":
+                    members = [
+                        info.filename
+                        for info in zip_file.infolist()
+                        if not info.is_dir()
+                    ]
+                member_paths = {
+                    member: get_member_target_path(target_path, member)
+                    for member in members
+                }
+            for member, member_path in member_paths.items():
+                print(f"extracting '{member}' to '{member_path}'")
+                os.makedirs(
+                    os.path.dirname(os.path.abspath(member_path)), exist_ok=True
+                )
+                with zip_file.open(member) as f:
+                    copy_to_file_atomically(f, member_path, chunk_size)
+
+
+def download_data(url: str, name: str, unzip=False, sha256: str = None):
     """
-    Downloads a file from a URL to the DATA_DIR under the given name
+    Downloads a file from a URL to the DATA_DIR under the given name (if sha256 is given, the checksum of a downloaded ZIP is verified)
     """
     target_path = os.path.join(DATA_DIR, name)
     if unzip:
-        download_and_extract_zip(url, target_path)
+        download_and_extract_zip(url, target_path, sha256=sha256)
         print("Downloaded and extracted data")
     else:
-        download(url, target_path)
+        # imported here because helpers.fetch itself imports from helpers
+        from .fetch import fetch_file
+
+        fetch_file(url, target_path)
         print("Downloaded data")
 
 
-def get_data_path(name: str, download_url: str = None, unzip=False):
+def get_data_path(name: str, download_url: str = None, unzip=False, sha256: str = None):
     """
     Returns the local absolute path for a file in DATA_DIR.
 
     If a download_url is provided and the data is not available locally, it will be fetched from this URL and stored inside the DATA_DIR under the given name. The path will be returned afterwards.
 
-    In the case that the remote file is a zip file that should be extracted, set unzip to True.
+    In the case that the remote file is a zip file that should be extracted, set unzip to True (and pass its sha256 checksum to verify the download).
+
+    Files listed in the data manifest (see helpers.fetch) are checked for their size and checksum (and fetched from the URL in the manifest if they are missing or broken).
     """
+    from .fetch import load_data_manifest, fetch_data_file
+
     target_path = os.path.join(DATA_DIR, name)
+    manifest = load_data_manifest()
+    if name in manifest:
+        return fetch_data_file(name, manifest[name])
     if not os.path.exists(target_path):
         print(f"'{name}' not available locally")
         if not download_url:
@@ -83,7 +150,7 @@ def get_data_path(name: str, download_url: str = None, unzip=False):
             print(
                 f"Fetching data from '{download_url}'{'(will unzip afterwards)' if unzip else ''}"
             )
-            download_data(download_url, name, unzip=unzip)
+            download_data(download_url, name, unzip=unzip, sha256=sha256)
     return target_path
 
 
@@ -116,33 +183,232 @@ def get_spotify_link(id: str, item_type: str = "track"):
     return f"https://open.spotify.com/{item_type}/{id}"
 
 
+def read_parquet(path):
+    """
+    Reads a parquet file into a DataFrame.
+
+    List columns are returned as columns of plain Python lists (pyarrow would give us numpy arrays otherwise), so the result looks exactly like what we'd get from parsing the CSV.
+    """
+    table = pq.read_table(path)
+    df = table.to_pandas()
+    # pyarrow only restores categoricals of strings, not e.g. of dates
+    for col in (table.schema.pandas_metadata or {}).get("columns", []):
+        name = col["name"]
+        if (
+            col["pandas_type"] == "categorical"
+            and name in df.columns
+            and not isinstance(df[name].dtype, pd.CategoricalDtype)
+        ):
+            df[name] = df[name].astype(
+                pd.CategoricalDtype(ordered=col["metadata"]["ordered"])
+            )
+    for field in table.schema:
+        if pa.types.is_list(field.type) and field.name in df.columns:
+            df[field.name] = pd.Series(
+                table.column(field.name).to_pylist(), index=df.index, dtype=object
+            )
+    return df
+
+
+def write_parquet(df: pd.DataFrame, path):
+    """
+    Writes df to path atomically (via a temporary file), so that readers never see a half-written file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, engine="pyarrow", index=True)
+    os.replace(tmp_path, path)
+
+
+def get_source_key(path):
+    """
+    Returns a string identifying the current version of the file at path (based on its size and modification time).
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def read_csv_cached(name: str, nested_columns=(), **read_csv_kwargs):
+    """
+    Reads the CSV file with the given name from DATA_DIR (passing read_csv_kwargs to pd.read_csv). nested_columns are parsed with helpers.nested.parse_nested_column.
+
+    The first read stores a typed parquet copy of the parsed data in CACHE_DIR, keyed on the size and modification time of the CSV. Subsequent reads of the same version of the file come straight from that copy, so the (slow) text parsing and converters only run once.
+    """
+    source_path = get_data_path(name)
+    cache_name = name.replace(os.sep, "_").removesuffix(".csv")
+    cache_path = os.path.join(
+        CACHE_DIR, f"{cache_name}.{get_source_key(source_path)}.parquet"
+    )
+    if os.path.exists(cache_path):
+        return read_parquet(cache_path)
+
+    df = pd.read_csv(source_path, **read_csv_kwargs)
+    for col in nested_columns:
+        df[col] = parse_nested_column(df[col])
+    # copies of older versions of the CSV are useless now
+    for stale_path in Path(CACHE_DIR).glob(f"{cache_name}.*.parquet"):
+        stale_path.unlink()
+    write_parquet(df, cache_path)
+    return df
+
+
+def get_code_fingerprint(func):
+    """
+    Returns a hash of the source code of func (or of a function decorated with disk_cache, including its upstream data).
+    """
+    if hasattr(func, "fingerprint"):
+        return func.fingerprint()
+    try:
+        code = inspect.getsource(func).encode()
+    except (OSError, TypeError):
+        # source not available (e.g. function defined in an interactive session)
+        code = func.__code__.co_code
+    return hashlib.sha256(code).hexdigest()
+
+
+def enforce_memo_dir_size_limit(limit=MEMO_DIR_SIZE_LIMIT):
+    """
+    Deletes the least recently used files in MEMO_DIR until their total size is below limit.
+    """
+    files = [path for path in Path(MEMO_DIR).glob("*.parquet")]
+    # st_mtime of memoized results is bumped whenever they are read, see disk_cache
+    files.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    total_size = 0
+    for path in files:
+        total_size += path.stat().st_size
+        if total_size > limit:
+            path.unlink()
+
+
+def disk_cache(sources=(), depends_on=()):
+    """
+    Decorator for memoizing functions that return DataFrames on disk (in MEMO_DIR, as parquet), so that results survive kernel restarts and new Python processes.
+
+    A result is reused only if the source code of the function, the data files it reads from (sources, names of files in DATA_DIR), the functions it depends on (depends_on) and the arguments passed are still the same. Otherwise, it is recomputed.
+
+    Within a process, results are additionally kept in memory (just like functools.cache).
+    """
+
+    def decorator(func):
+        in_memory = {}
+
+        def fingerprint():
+            h = hashlib.sha256()
+            h.update(get_code_fingerprint(func).encode())
+            for name in sources:
+                h.update(name.encode())
+                h.update(get_source_key(get_data_path(name)).encode())
+            for dependency in depends_on:
+                h.update(get_code_fingerprint(dependency).encode())
+            return h.hexdigest()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = hashlib.sha256(
+                (fingerprint() + repr(args) + repr(sorted(kwargs.items()))).encode()
+            ).hexdigest()
+            if key in in_memory:
+                return in_memory[key]
+
+            path = os.path.join(
+                MEMO_DIR, f"{func.__module__}.{func.__qualname__}.{key[:16]}.parquet"
+            )
+            if os.path.exists(path):
+                result = read_parquet(path)
+                os.utime(path)  # mark as recently used
+            else:
+                result = func(*args, **kwargs)
+                if not args and not kwargs:
+                    # other stored results of argument-less functions can only be outdated
+                    for stale_path in Path(MEMO_DIR).glob(
+                        f"{func.__module__}.{func.__qualname__}.*.parquet"
+                    ):
+                        stale_path.unlink()
+                write_parquet(result, path)
+                enforce_memo_dir_size_limit()
+            in_memory[key] = result
+            return result
+
+        wrapper.fingerprint = fingerprint
+        wrapper.cache_clear = in_memory.clear
+        return wrapper
+
+    return decorator
+
+
 @cache
 def get_track_data():
-    track_data = pd.read_csv(
-        get_data_path("top50_track_data.csv"),
+    track_data = read_csv_cached(
+        "top50_track_data.csv",
         index_col="id",
         dtype={"album_type": "category"},
-        converters={"genres": literal_eval},
+        nested_columns=("genres",),
         parse_dates=["album_release_date"],
     )
     return track_data
 
 
-@cache
-def get_charts():
-    charts = pd.read_csv(
-        get_data_path("top50.csv"),
+def read_charts_csv():
+    return read_csv_cached(
+        "top50.csv",
         parse_dates=["date"],
+        dtype={"region": "category"},
     )
-    return charts
+
+
+def compact_chart_columns(charts: pd.DataFrame):
+    """
+    Dictionary-encodes the region, id and date columns of charts (as categoricals, i.e. integer codes + a lookup table of the distinct values) and narrows rank and streams to int8 and int32.
+    """
+    return charts.assign(
+        region=charts.region.astype("category"),
+        date=pd.Categorical(charts.date, ordered=True),
+        id=charts.id.astype("category"),
+        rank=charts["rank"].astype("int8"),
+        streams=charts.streams.astype(
+            "int32" if charts.streams.notna().all() else "Int32"
+        ),
+    )
+
+
+@disk_cache(sources=("top50.csv",), depends_on=(read_charts_csv,))
+def get_compact_charts():
+    return compact_chart_columns(read_charts_csv())
+
+
+@cache
+def get_all_charts(compact=False):
+    if compact:
+        return get_compact_charts()
+    return read_charts_csv()
+
+
+def get_charts(compact=False, regions=None, start=None, end=None):
+    """
+    Returns the data of top50.csv.
+
+    With compact=True, a memory-compact version is returned (see compact_chart_columns): regions, track IDs and dates are categoricals, so e.g. charts.id.cat.codes are integer track IDs and charts.id.cat.categories is the lookup table for decoding them. Filtering rows (as in get_countries_charts(compact=True) and get_global_charts(compact=True)) keeps the categories, so the codes are the same in all of those tables.
+
+    If regions (a region name or a list of them), start or end (dates, inclusive) are given, only the matching charts are read from the partitioned copy of top50.csv (see helpers.chunked.read_charts), without loading the rest. The categories of compact results then only cover the rows that were read.
+    """
+    if regions is None and start is None and end is None:
+        return get_all_charts(compact)
+    # imported here because helpers.chunked itself imports from helpers
+    from .chunked import read_charts
+
+    return read_charts(regions, start, end, compact=compact)
+
+
+get_charts.cache_clear = get_all_charts.cache_clear
 
 
 @cache
 def get_country_data():
-    spotify_country_data = pd.read_csv(
-        get_data_path("spotify_region_metadata.csv"),
+    spotify_country_data = read_csv_cached(
+        "spotify_region_metadata.csv",
         index_col="spotify_region",
         dtype={
+            "spotify_region": "category",
             "iso_alpha3": "category",
             "iso_alpha2": "category",
             "geo_region": "category",
@@ -152,19 +418,37 @@ def get_country_data():
     return spotify_country_data
 
 
-@cache
-def get_countries_charts():
-    charts = get_charts()
+def add_country_data(charts: pd.DataFrame):
+    """
+    Drops the global charts from charts and adds the metadata of each country (region is renamed to country).
+    """
     charts = charts[charts.region != "Global"].rename(columns={"region": "country"})
+    charts["country"] = charts.country.cat.remove_unused_categories()
     country_data = get_country_data()
     return pd.merge(
         charts, country_data, left_on="country", right_index=True
     ).reset_index(drop=True)
 
 
-@cache
-def get_global_charts():
-    charts = get_charts()
+@disk_cache(
+    sources=("top50.csv", "spotify_region_metadata.csv"),
+    depends_on=(get_all_charts, get_compact_charts, get_country_data, add_country_data),
+)
+def get_countries_charts(compact=False):
+    """
+    Returns the charts of all countries (i.e. without the global charts), with the metadata of each country. See get_charts for compact.
+
+    For an out-of-core version (for machines that can't hold all charts in memory), see helpers.chunked.iter_countries_charts.
+    """
+    return add_country_data(get_charts(compact=compact))
+
+
+@disk_cache(sources=("top50.csv",), depends_on=(get_all_charts, get_compact_charts))
+def get_global_charts(compact=False):
+    """
+    Returns the global charts. See get_charts for compact.
+    """
+    charts = get_charts(compact=compact)
     return (
         charts[charts.region == "Global"].drop(columns="region").reset_index(drop=True)
     )
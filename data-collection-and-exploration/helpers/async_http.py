@@ -0,0 +1,132 @@
+"""
+Building blocks for fetching lots of data from rate-limited HTTP APIs concurrently (using asyncio/aiohttp).
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+
+
+class TokenBucket:
+    """
+    Simple token bucket rate limiter: allows rate requests per second on average, with bursts of up to capacity requests.
+
+    pause() can be used to block all requests for a while (e.g. if the server tells us to back off via a Retry-After header).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class RetriesExhaustedError(Exception):
+    pass
+
+
+def get_backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0):
+    """
+    Exponential backoff with "full jitter" (see https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/)
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def get_retry_after(headers, default: float):
+    try:
+        return float(headers.get("Retry-After", default))
+    except ValueError:
+        # Retry-After may also be an HTTP date - we don't bother parsing that
+        return default
+
+
+async def request_with_retries(
+    session: aiohttp.ClientSession,
+    method: str,
+    url: str,
+    rate_limiter: TokenBucket = None,
+    max_retries: int = 5,
+    read="json",
+    **request_kwargs,
+):
+    """
+    Sends a request, retrying on connection errors, timeouts, 429 and 5xx responses (with capped exponential backoff + jitter).
+
+    If a rate_limiter is given, every attempt waits for a token first; 429 responses pause the rate limiter for as long as the Retry-After header asks us to.
+
+    read determines what is returned: "json" (parsed response body), "bytes" or "text". Other 4xx responses raise aiohttp.ClientResponseError.
+    """
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+        try:
+            async with session.request(method, url, **request_kwargs) as resp:
+                if resp.status == 429:
+                    retry_after = get_retry_after(
+                        resp.headers, get_backoff_delay(attempt)
+                    )
+                    if rate_limiter is not None:
+                        rate_limiter.pause(retry_after)
+                    else:
+                        await asyncio.sleep(retry_after)
+                    continue
+                if resp.status >= 500:
+                    await asyncio.sleep(get_backoff_delay(attempt))
+                    continue
+                resp.raise_for_status()
+                if read == "json":
+                    return await resp.json()
+                if read == "text":
+                    return await resp.text()
+                return await resp.read()
+        except (
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+            asyncio.TimeoutError,
+        ):
+            await asyncio.sleep(get_backoff_delay(attempt))
+    raise RetriesExhaustedError(
+        f"{method} {url} failed after {max_retries + 1} attempts"
+    )
+
+
+def run_coroutine(coro):
+    """
+    Runs coro to completion and returns its result.
+
+    Unlike asyncio.run, this also works if an event loop is already running in the current thread (e.g. in Jupyter or VS Code interactive windows).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
@@ -0,0 +1,198 @@
+"""
+Concurrent downloads of daily chart CSVs from Spotify Charts (charts.spotify.com) over HTTP, without driving a browser.
+
+A job is a (region code, date) pair - region codes are the ones used by Spotify (lowercase ISO alpha-2 codes and 'global', see helpers.ingest.get_region_code_to_name). Each job is downloaded to regional-<code>-daily-<date>.csv in the target folder (the file names helpers.ingest.ingest_scraped_chart_files expects). Jobs whose file already exists are skipped, so interrupted downloads can simply be restarted.
+
+The charts API needs the access token of a logged in Spotify Charts session (open charts.spotify.com in the browser while logged in and copy the bearer token of the requests to the charts API from the network tab). It is read from the SPOTIFY_CHARTS_TOKEN environment variable (and only valid for about an hour).
+"""
+
+import asyncio
+import io
+import json
+import os
+import time
+import aiohttp
+import pandas as pd
+from .async_http import TokenBucket, request_with_retries, run_coroutine
+
+CHARTS_URL_TEMPLATE = "https://charts-spotify-com-service.spotify.com/auth/v0/charts/regional-{code}-daily/{date}"
+
+# columns of the CSVs offered for download on charts.spotify.com
+CHART_CSV_COLUMNS = [
+    "rank",
+    "uri",
+    "artist_names",
+    "track_name",
+    "source",
+    "peak_rank",
+    "previous_rank",
+    "days_on_chart",
+    "streams",
+]
+
+
+def get_chart_file_name(code: str, date):
+    return f"regional-{code}-daily-{pd.Timestamp(date):%Y-%m-%d}.csv"
+
+
+def get_chart_jobs(region_codes, dates):
+    """
+    Returns a DataFrame with a job (code and date column) for every combination of region_codes and dates.
+    """
+    return pd.MultiIndex.from_product(
+        [list(region_codes), pd.to_datetime(list(dates))], names=["code", "date"]
+    ).to_frame(index=False)
+
+
+def chart_entries_to_csv(response: dict):
+    """
+    Converts the chart entries in a response of the charts API to the CSV format of the files offered for download on charts.spotify.com.
+    """
+    rows = [
+        {
+            "rank": entry["chartEntryData"]["currentRank"],
+            "uri": entry["trackMetadata"]["trackUri"],
+            "artist_names": ", ".join(
+                artist["name"] for artist in entry["trackMetadata"]["artists"]
+            ),
+            "track_name": entry["trackMetadata"]["trackName"],
+            "source": (entry["trackMetadata"].get("labels") or [{}])[0].get("name"),
+            "peak_rank": entry["chartEntryData"]["peakRank"],
+            "previous_rank": entry["chartEntryData"]["previousRank"],
+            "days_on_chart": entry["chartEntryData"]["appearancesOnChart"],
+            "streams": entry["chartEntryData"]["rankingMetric"]["value"],
+        }
+        for entry in response["entries"]
+    ]
+    out = io.StringIO()
+    pd.DataFrame(rows, columns=CHART_CSV_COLUMNS).to_csv(out, index=False)
+    return out.getvalue().encode()
+
+
+def write_file_atomically(path, content: bytes):
+    # readers (and the skip check) never see partially written files
+    part_path = f"{path}.part"
+    with open(part_path, "wb") as f:
+        f.write(content)
+    os.replace(part_path, path)
+
+
+class ChartDownloader:
+    """
+    Downloads chart CSVs for lots of jobs concurrently over a single pooled session.
+
+    max_concurrency limits the number of requests in flight, max_per_host the number of connections per host and requests_per_second the average request rate. 429 and 5xx responses are retried (see helpers.async_http.request_with_retries).
+
+    url_template (with {code} and {date} placeholders) can be pointed to a local fake charts server for testing. Responses are written as they are if they are CSVs, JSON responses of the charts API are converted to CSV first.
+
+    async with ChartDownloader(target_dir) as downloader:
+        results = await downloader.download(jobs)
+    """
+
+    def __init__(
+        self,
+        target_dir,
+        token: str = None,
+        max_concurrency: int = 16,
+        max_per_host: int = 8,
+        requests_per_second: float = 10,
+        max_retries: int = 5,
+        url_template: str = CHARTS_URL_TEMPLATE,
+    ):
+        self.token = token or os.getenv("SPOTIFY_CHARTS_TOKEN")
+        if not self.token:
+            raise RuntimeError(
+                "No Spotify Charts token found! Set SPOTIFY_CHARTS_TOKEN (e.g. in a .env file), see helpers/chart_download.py"
+            )
+        self.target_dir = target_dir
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.url_template = url_template
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_concurrency, limit_per_host=self.max_per_host
+            ),
+            timeout=aiohttp.ClientTimeout(total=60),
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.rate_limiter = TokenBucket(self.requests_per_second)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def download_job(self, code: str, date):
+        """
+        Downloads the chart CSV of a single job, returning its status: "skipped" (file exists already), "downloaded", "not_found" (no chart for that region and day) or "failed".
+        """
+        path = os.path.join(self.target_dir, get_chart_file_name(code, date))
+        if os.path.exists(path):
+            return "skipped"
+        url = self.url_template.format(code=code, date=f"{pd.Timestamp(date):%Y-%m-%d}")
+        async with self.semaphore:
+            try:
+                content = await request_with_retries(
+                    self.session,
+                    "GET",
+                    url,
+                    rate_limiter=self.rate_limiter,
+                    max_retries=self.max_retries,
+                    read="bytes",
+                )
+            except aiohttp.ClientResponseError as e:
+                if e.status == 404:
+                    return "not_found"
+                if e.status == 401:
+                    raise RuntimeError(
+                        "Spotify Charts rejected the token (it probably expired), set a new SPOTIFY_CHARTS_TOKEN"
+                    ) from e
+                print(f"downloading {url} failed: {e}")
+                return "failed"
+            except Exception as e:
+                print(f"downloading {url} failed: {e}")
+                return "failed"
+        if content.lstrip().startswith(b"{"):
+            content = chart_entries_to_csv(json.loads(content))
+        write_file_atomically(path, content)
+        return "downloaded"
+
+    async def download(self, jobs: pd.DataFrame):
+        """
+        Downloads the chart CSVs for all jobs (a DataFrame with code and date column, see get_chart_jobs) concurrently. Returns jobs with the status of each job (see download_job) in a status column.
+        """
+        os.makedirs(self.target_dir, exist_ok=True)
+        start_time = time.monotonic()
+        statuses = await asyncio.gather(
+            *[self.download_job(job.code, job.date) for job in jobs.itertuples()]
+        )
+        jobs = jobs.assign(status=statuses)
+        elapsed = time.monotonic() - start_time
+        downloaded = (jobs.status == "downloaded").sum()
+        print(
+            f"{downloaded} chart files downloaded in {elapsed:.1f}s ({downloaded / max(elapsed, 1e-9):.1f} files/s);",
+            ", ".join(
+                f"{count} {status}"
+                for status, count in jobs.status.value_counts().items()
+            ),
+        )
+        return jobs
+
+
+def download_chart_csvs(jobs: pd.DataFrame, target_dir, **downloader_kwargs):
+    """
+    Synchronous wrapper around ChartDownloader.download (for use in scripts and notebooks).
+
+    downloader_kwargs are passed on to ChartDownloader.
+    """
+
+    async def download():
+        async with ChartDownloader(target_dir, **downloader_kwargs) as downloader:
+            return await downloader.download(jobs)
+
+    return run_coroutine(download())
@@ -0,0 +1,124 @@
+"""
+Precomputed aggregates of the country charts per (track, region) pair, so that selections like "tracks that only charted in region X" don't need a scan of the full chart table.
+
+Regions can be countries, geo regions or geo subregions (see CHART_INDEX_LEVELS).
+"""
+
+from functools import cache
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from . import get_country_data, add_country_data, disk_cache
+from .chunked import iter_countries_charts
+
+# name of the level -> column of the country charts
+CHART_INDEX_LEVELS = {
+    "country": "country",
+    "region": "geo_region",
+    "subregion": "geo_subregion",
+}
+
+
+@disk_cache(
+    sources=("top50.csv", "spotify_region_metadata.csv"),
+    depends_on=(iter_countries_charts, add_country_data),
+)
+def get_track_region_index(level="region"):
+    """
+    Returns a DataFrame with one row for every (track, region) pair in which the track charted, with the first and last date it charted there, the number of days it charted, its best rank and its total streams.
+
+    The columns are id, <level> (e.g. region), first_date, last_date, days_charted, best_rank and total_streams; rows are sorted by id and <level>.
+
+    The charts are aggregated month by month (see helpers.chunked.iter_countries_charts), so this never needs all of the charts in memory.
+    """
+    column = CHART_INDEX_LEVELS[level]
+    monthly_aggregates = [
+        charts.assign(streams=charts.streams.astype("int64"))
+        .groupby(["id", column], observed=True)
+        .agg(
+            first_date=("date", "min"),
+            last_date=("date", "max"),
+            days_charted=("date", "nunique"),
+            best_rank=("rank", "min"),
+            total_streams=("streams", "sum"),
+        )
+        for _, charts in iter_countries_charts(by="month")
+    ]
+    # every day is in exactly one month, so days charted can be summed up
+    index = (
+        pd.concat(monthly_aggregates)
+        .groupby(level=["id", column], observed=True)
+        .agg(
+            first_date=("first_date", "min"),
+            last_date=("last_date", "max"),
+            days_charted=("days_charted", "sum"),
+            best_rank=("best_rank", "min"),
+            total_streams=("total_streams", "sum"),
+        )
+        .reset_index()
+        .rename(columns={column: level})
+    )
+    index["id"] = index.id.astype(str)
+    index[level] = index[level].astype("category").cat.remove_unused_categories()
+    return index
+
+
+@cache
+def build_track_region_matrix(level: str, value: str, index_fingerprint: str):
+    index = get_track_region_index(level)
+    track_codes, track_ids = pd.factorize(index.id)
+    regions = index[level].cat.categories
+    matrix = sparse.csr_matrix(
+        (index[value].to_numpy(), (track_codes, index[level].cat.codes.to_numpy())),
+        shape=(len(track_ids), len(regions)),
+    )
+    return matrix, pd.Index(track_ids, name="id"), regions
+
+
+def get_track_region_matrix(level="region", value="days_charted"):
+    """
+    Returns the given column of the (track, region) index as sparse (CSR) matrix with one row per track and one column per region (0 where a track never charted in a region), along with the track IDs (rows) and regions (columns).
+
+    The matrix is kept in memory for the current version of the index, i.e. it is re-built after charts were appended (see helpers.ingest).
+    """
+    return build_track_region_matrix(level, value, get_track_region_index.fingerprint())
+
+
+def get_tracks_charting_only_in_one(level="region"):
+    """
+    Returns a DataFrame with the ID of every track that charted in exactly one region (of the given level) and that region (<level> column).
+    """
+    matrix, track_ids, regions = get_track_region_matrix(level)
+    only_in_one = np.flatnonzero(matrix.getnnz(axis=1) == 1)
+    region_codes = matrix[only_in_one].indices
+    return pd.DataFrame(
+        {
+            "id": track_ids[only_in_one],
+            level: pd.Categorical.from_codes(region_codes, categories=regions),
+        }
+    )
+
+
+def get_tracks_charting_in(region: str, level="region", only=False):
+    """
+    Returns the IDs of all tracks that charted in the given region (of the given level), or, with only=True, of those that charted in no other region.
+    """
+    matrix, track_ids, regions = get_track_region_matrix(level)
+    column = matrix[:, regions.get_loc(region)]
+    charted = np.zeros(len(track_ids), dtype=bool)
+    charted[column.nonzero()[0]] = True
+    if only:
+        charted &= matrix.getnnz(axis=1) == 1
+    return track_ids[charted]
+
+
+def get_subregion_to_region():
+    """
+    Returns a Series mapping each geo subregion to the geo region it belongs to.
+    """
+    country_data = get_country_data()
+    return (
+        country_data.drop_duplicates("geo_subregion")
+        .set_index("geo_subregion")
+        .geo_region
+    )
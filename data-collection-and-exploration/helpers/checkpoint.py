@@ -0,0 +1,143 @@
+"""
+Checkpointing for crawlers: results are appended to a single SQLite file per crawler instead of thousands of chunk CSVs.
+"""
+
+import json
+import os
+import sqlite3
+from io import StringIO
+import pandas as pd
+from . import DATA_DIR
+
+CHECKPOINT_DIR = os.path.join(DATA_DIR, "checkpoints")
+
+
+def collapse_into_ranges(positions):
+    """
+    Turns a collection of integers into a sorted list of (start, stop) ranges covering exactly those integers (stop exclusive).
+    """
+    ranges = []
+    for pos in sorted(set(positions)):
+        if ranges and ranges[-1][1] == pos:
+            ranges[-1][1] = pos + 1
+        else:
+            ranges.append([pos, pos + 1])
+    return [tuple(r) for r in ranges]
+
+
+class CheckpointStore:
+    """
+    Append-only store for crawler results, backed by a single SQLite file in CHECKPOINT_DIR.
+
+    Every result is stored as JSON under a unique key (e.g. the Spotify ID it belongs to) and, optionally, the position of that key in the crawler's list of work items. Those positions are also recorded in a manifest of completed ranges.
+
+    Keys of all stored results are kept in memory, so checking whether a key is done (`key in store`) is O(1). Results may also be None (e.g. if an API didn't know an ID) - such keys count as done, but don't show up in to_frame().
+    """
+
+    def __init__(self, name: str):
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        self.path = os.path.join(CHECKPOINT_DIR, f"{name}.sqlite")
+        # results may be added from the thread the crawler's event loop runs in (see helpers.async_http.run_coroutine)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, position INTEGER, data TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS manifest (start INTEGER, stop INTEGER)"
+            )
+        self.keys = {key for (key,) in self.conn.execute("SELECT key FROM records")}
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def missing(self, keys):
+        """
+        Returns the keys (in the given order) that are not done yet.
+        """
+        return [key for key in keys if key not in self.keys]
+
+    def add(self, keys, values, positions=None):
+        """
+        Stores the given values under the given keys (in a single transaction). Values must be JSON-serializable (or None).
+
+        positions (if given) are the positions of the keys in the crawler's list of work items.
+        """
+        keys = list(keys)
+        positions = (
+            [int(pos) for pos in positions]
+            if positions is not None
+            else [None] * len(keys)
+        )
+        rows = [
+            (key, pos, json.dumps(value))
+            for key, pos, value in zip(keys, positions, values)
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO records (key, position, data) VALUES (?, ?, ?)",
+                rows,
+            )
+            self.conn.executemany(
+                "INSERT INTO manifest (start, stop) VALUES (?, ?)",
+                collapse_into_ranges(pos for pos in positions if pos is not None),
+            )
+        self.keys.update(keys)
+
+    def add_frame(self, df: pd.DataFrame, key_column: str):
+        """
+        Stores each row of df (e.g. from chunk CSVs written by older versions of the crawlers) under the value of its key_column.
+        """
+        records = df.astype(object).where(df.notna(), None).to_dict("records")
+        self.add(df[key_column], records)
+
+    def completed_ranges(self):
+        """
+        Returns the (start, stop) ranges of work item positions that are done.
+        """
+        return collapse_into_ranges(
+            pos
+            for start, stop in self.conn.execute("SELECT start, stop FROM manifest")
+            for pos in range(start, stop)
+        )
+
+    def values(self, keys=None):
+        """
+        Returns the stored values (ordered by position, then insertion order), or only those for the given keys (in the given order).
+        """
+        rows = self.conn.execute(
+            "SELECT key, data FROM records ORDER BY position, rowid"
+        ).fetchall()
+        if keys is None:
+            return [json.loads(data) for _, data in rows]
+        data_by_key = dict(rows)
+        return [json.loads(data_by_key[key]) for key in keys if key in data_by_key]
+
+    def to_frame(self, keys=None):
+        """
+        Materializes all stored results (or only those for the given keys, in the given order) as a DataFrame, with one row per non-None value.
+        """
+        if keys is None:
+            rows = self.conn.execute(
+                "SELECT data FROM records WHERE data != 'null' ORDER BY position, rowid"
+            ).fetchall()
+            lines = [data for (data,) in rows]
+        else:
+            data_by_key = dict(
+                self.conn.execute("SELECT key, data FROM records WHERE data != 'null'")
+            )
+            lines = [data_by_key[key] for key in keys if key in data_by_key]
+        if not lines:
+            return pd.DataFrame()
+        # parsing all records in one go is much faster than calling json.loads for each of them
+        return pd.read_json(
+            StringIO("\n".join(lines)), lines=True, dtype=False, convert_dates=False
+        )
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,228 @@
+"""
+Partitioned storage and out-of-core processing of the chart data.
+
+A copy of top50.csv is kept as a hive-partitioned parquet dataset (CHART_DATASET_DIR/region=<region>/month=<YYYY-MM>/*.parquet), so reading the charts of some regions and/or some time range only touches the files of those partitions (see read_charts, which get_charts uses when it gets filters), and the whole history can be streamed one month or region at a time (see iter_charts and iter_countries_charts) instead of being loaded all at once.
+"""
+
+import os
+import shutil
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+from . import (
+    DATA_DIR,
+    get_data_path,
+    get_source_key,
+    get_country_data,
+    add_country_data,
+    compact_chart_columns,
+)
+
+CHART_DATASET_DIR = os.path.join(DATA_DIR, "top50_partitioned")
+
+# version (see get_source_key) of top50.csv the partitioned dataset reflects (files starting with _ are ignored by pyarrow.dataset)
+CHART_DATASET_SOURCE_KEY_FILE = "_source_key"
+
+CHART_ARROW_TYPES = {
+    "region": pa.string(),
+    "date": pa.timestamp("s"),
+    "rank": pa.int8(),
+    "streams": pa.int32(),
+    "id": pa.string(),
+}
+
+CHART_PARTITIONING = ds.partitioning(
+    pa.schema([("region", pa.string()), ("month", pa.string())]), flavor="hive"
+)
+
+# top50.csv is converted in blocks of this size (i.e. this is about the amount of CSV data in memory during the conversion)
+CSV_BLOCK_SIZE = 64 * 1024**2  # bytes
+
+
+def get_chart_dataset_source_key(dataset_dir=CHART_DATASET_DIR):
+    path = os.path.join(dataset_dir, CHART_DATASET_SOURCE_KEY_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip()
+
+
+def store_chart_dataset_source_key(source_key: str, dataset_dir=CHART_DATASET_DIR):
+    path = os.path.join(dataset_dir, CHART_DATASET_SOURCE_KEY_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        f.write(source_key)
+    os.replace(f"{path}.tmp", path)
+
+
+def to_partitioned_chart_batch(batch: pa.RecordBatch):
+    """
+    Casts a batch of chart rows to CHART_ARROW_TYPES and adds the month column the dataset is partitioned by.
+    """
+    columns = list(CHART_ARROW_TYPES)
+    batch = pa.RecordBatch.from_arrays(
+        [batch.column(name).cast(CHART_ARROW_TYPES[name]) for name in columns],
+        names=columns,
+    )
+    return batch.append_column("month", pc.strftime(batch.column("date"), "%Y-%m"))
+
+
+def write_chart_batches(batches, dataset_dir, basename_template="part-{i}.parquet"):
+    schema = pa.schema([*CHART_ARROW_TYPES.items(), ("month", pa.string())])
+    ds.write_dataset(
+        (to_partitioned_chart_batch(batch) for batch in batches),
+        dataset_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=CHART_PARTITIONING,
+        basename_template=basename_template,
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def write_partitioned_charts():
+    """
+    (Re-)writes the partitioned dataset from top50.csv, streaming the CSV in blocks (it is never loaded into memory as a whole).
+    """
+    source_path = get_data_path("top50.csv")
+    source_key = get_source_key(source_path)
+    tmp_dir = f"{CHART_DATASET_DIR}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    reader = pv.open_csv(
+        source_path,
+        read_options=pv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        # streams may be written as floats (e.g. 1234.0), they are cast to ints when writing
+        convert_options=pv.ConvertOptions(
+            column_types={**CHART_ARROW_TYPES, "streams": pa.float64()}
+        ),
+    )
+    print(f"writing partitioned charts to '{CHART_DATASET_DIR}'")
+    write_chart_batches(reader, tmp_dir)
+    store_chart_dataset_source_key(source_key, tmp_dir)
+    shutil.rmtree(CHART_DATASET_DIR, ignore_errors=True)
+    os.replace(tmp_dir, CHART_DATASET_DIR)
+
+
+def append_partitioned_charts(rows: pd.DataFrame, previous_source_key: str):
+    """
+    Adds rows that were just appended to top50.csv to the partitioned dataset (as new files in the affected partitions).
+
+    previous_source_key is the version of top50.csv before the rows were appended - if the dataset doesn't reflect that version, it is left alone (and re-written from scratch the next time it is used).
+    """
+    if get_chart_dataset_source_key() != previous_source_key:
+        return
+    table = pa.Table.from_pandas(
+        rows[list(CHART_ARROW_TYPES)].astype({"region": str}), preserve_index=False
+    )
+    write_chart_batches(
+        table.to_batches(),
+        CHART_DATASET_DIR,
+        basename_template=f"append-{uuid.uuid4().hex}-{{i}}.parquet",
+    )
+    store_chart_dataset_source_key(get_source_key(get_data_path("top50.csv")))
+
+
+def get_charts_dataset():
+    """
+    Returns the partitioned chart dataset (as pyarrow.dataset.Dataset), writing it first if it doesn't reflect the current version of top50.csv.
+    """
+    if get_chart_dataset_source_key() != get_source_key(get_data_path("top50.csv")):
+        write_partitioned_charts()
+    return ds.dataset(CHART_DATASET_DIR, format="parquet", partitioning="hive")
+
+
+def get_chart_filter(regions=None, start=None, end=None):
+    """
+    Returns a pyarrow.dataset expression selecting the charts of the given regions between start and end (inclusive, both optional), or None if there is nothing to filter.
+
+    Conditions on the partition columns are included, so that only the files of matching partitions are read.
+    """
+    conditions = []
+    if regions is not None:
+        regions = [regions] if isinstance(regions, str) else list(regions)
+        conditions.append(ds.field("region").isin(regions))
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions.append(ds.field("month") >= start.strftime("%Y-%m"))
+        conditions.append(ds.field("date") >= start)
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions.append(ds.field("month") <= end.strftime("%Y-%m"))
+        conditions.append(ds.field("date") <= end)
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def chart_table_to_frame(table: pa.Table):
+    charts = table.to_pandas()
+    if "region" in charts.columns:
+        charts["region"] = charts.region.astype("category")
+    return charts
+
+
+def read_charts(regions=None, start=None, end=None, compact=False):
+    """
+    Reads the charts of the given regions (a region name or a list of them) between start and end (inclusive, both optional) from the partitioned dataset. See get_charts for compact.
+    """
+    table = get_charts_dataset().to_table(
+        columns=list(CHART_ARROW_TYPES), filter=get_chart_filter(regions, start, end)
+    )
+    charts = chart_table_to_frame(table)
+    if compact:
+        charts = compact_chart_columns(charts)
+    return charts
+
+
+def get_chart_partition_keys(dataset: ds.Dataset, by="month"):
+    """
+    Returns the (sorted) months (as pd.Periods) or regions the charts in dataset are partitioned into.
+    """
+    keys = {
+        ds.get_partition_keys(fragment.partition_expression)[by]
+        for fragment in dataset.get_fragments()
+    }
+    if by == "month":
+        return sorted(pd.Period(month, freq="M") for month in keys)
+    return sorted(keys)
+
+
+def iter_charts(by="month", columns=None, filter=None):
+    """
+    Yields (partition key, charts of that partition) for every month or region (see get_chart_partition_keys) of top50.csv, reading only one partition into memory at a time.
+
+    columns and filter (a pyarrow.dataset expression) are applied while reading, i.e. before a partition is converted to a DataFrame.
+    """
+    if by not in ("month", "region"):
+        raise ValueError(f"Cannot partition charts by '{by}'")
+    dataset = get_charts_dataset()
+    columns = list(CHART_ARROW_TYPES) if columns is None else columns
+    for key in get_chart_partition_keys(dataset, by):
+        partition_filter = ds.field(by) == (
+            key.strftime("%Y-%m") if by == "month" else key
+        )
+        if filter is not None:
+            partition_filter = partition_filter & filter
+        table = dataset.to_table(columns=columns, filter=partition_filter)
+        if table.num_rows == 0:
+            continue
+        yield key, chart_table_to_frame(table)
+
+
+def iter_countries_charts(by="month"):
+    """
+    Out-of-core version of get_countries_charts: yields (partition key, charts of all countries in that partition, with the metadata of each country) for every month or region.
+
+    Data for a track is spread across several partitions - with partitions by month, the number of days a track charted (in some region) can simply be added up across partitions, as every day is in exactly one partition.
+    """
+    # all partitions get the same categories (otherwise, they'd be turned into plain strings when concatenated)
+    country_dtype = get_country_data().index.dtype
+    for key, charts in iter_charts(by, filter=ds.field("region") != "Global"):
+        countries_charts = add_country_data(charts)
+        countries_charts["country"] = countries_charts.country.astype(country_dtype)
+        yield key, countries_charts
@@ -0,0 +1,225 @@
+"""
+Coverage index of the charts: for every region and day, the number of chart positions (ranks) top50.csv has data for.
+
+The index is a small region x day matrix (~70 x 1800 cells, one byte each) stored next to the parquet caches. It is built from the partitioned copy of the charts (see helpers.chunked), one month at a time, and updated by helpers.ingest.append_chart_rows whenever charts are appended - so finding gaps never requires loading top50.csv.
+"""
+
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from . import CACHE_DIR, get_data_path, get_source_key
+from .chunked import iter_charts
+
+# number of positions of a complete chart
+CHART_SIZE = 50
+
+
+def get_coverage_path(source_key: str):
+    return os.path.join(CACHE_DIR, f"top50_coverage.{source_key}.npz")
+
+
+class ChartCoverage:
+    """
+    Number of ranks per region (rows of counts) and day (columns of counts, one per day from start to the last day of any region).
+
+    coverage = get_chart_coverage()
+    coverage.get_missing_cells()  # region/date pairs without any data
+    coverage.get_date_ranges()  # first and last day of each region
+    """
+
+    def __init__(self, counts: np.ndarray, regions, start):
+        self.counts = counts
+        self.regions = pd.Index(regions, name="region")
+        self.dates = (
+            pd.date_range(start, periods=counts.shape[1], freq="D", name="date")
+            if counts.shape[1] > 0
+            else pd.DatetimeIndex([], name="date")
+        )
+
+    @classmethod
+    def from_rank_counts(cls, rank_counts: pd.Series):
+        """
+        Creates the coverage index from a Series with the number of ranks for each (region, date) pair (in the index).
+        """
+        regions = rank_counts.index.get_level_values("region").astype(str)
+        dates = pd.DatetimeIndex(rank_counts.index.get_level_values("date"))
+        coverage = cls(np.zeros((0, 0), dtype=np.uint8), [], None)
+        coverage.add(regions, dates, rank_counts.to_numpy())
+        return coverage
+
+    def add(self, regions, dates, rank_counts):
+        """
+        Adds the given rank counts for (region, date) pairs (the index grows as needed).
+        """
+        regions = pd.Index(regions).astype(str)
+        dates = pd.DatetimeIndex(dates).normalize()
+        if len(dates) == 0:
+            return
+        self.extend(regions.unique(), dates.min(), dates.max())
+        rows = self.regions.get_indexer(regions)
+        cols = (dates - self.dates[0]).days.to_numpy()
+        counts = self.counts.astype(np.int64)
+        np.add.at(counts, (rows, cols), np.asarray(rank_counts, dtype=np.int64))
+        self.counts = np.minimum(counts, np.iinfo(np.uint8).max).astype(np.uint8)
+
+    def extend(self, regions, start, end):
+        new_regions = pd.Index(regions).difference(self.regions)
+        if len(self.dates) == 0:
+            new_start, new_end = start, end
+        else:
+            new_start, new_end = min(start, self.dates[0]), max(end, self.dates[-1])
+        n_days = (new_end - new_start).days + 1
+        if len(new_regions) == 0 and n_days == len(self.dates):
+            return
+        counts = np.zeros((len(self.regions) + len(new_regions), n_days), np.uint8)
+        if len(self.dates) > 0:
+            offset = (self.dates[0] - new_start).days
+            counts[: len(self.regions), offset : offset + len(self.dates)] = self.counts
+        self.counts = counts
+        self.regions = self.regions.append(new_regions).rename("region")
+        self.dates = pd.date_range(new_start, periods=n_days, freq="D", name="date")
+
+    def get_cells(self, mask: np.ndarray):
+        rows, cols = np.nonzero(mask)
+        return pd.DataFrame(
+            {
+                "region": self.regions[rows],
+                "date": self.dates[cols],
+                "rank_count": self.counts[rows, cols],
+            }
+        )
+
+    def get_missing_cells(self, within_region_range=False):
+        """
+        Returns the (region, date) pairs without any chart data, with a region, date and rank_count (always 0) column.
+
+        With within_region_range=True, only days between the first and last day of each region are considered (i.e. regions that were added to Spotify Charts later don't count as missing before that).
+        """
+        mask = self.counts == 0
+        if within_region_range:
+            mask &= self.get_region_range_mask()
+        return self.get_cells(mask)
+
+    def get_incomplete_cells(self, chart_size=CHART_SIZE):
+        """
+        Returns the (region, date) pairs that have some, but less than chart_size ranks (with region, date and rank_count column).
+        """
+        return self.get_cells((self.counts > 0) & (self.counts < chart_size))
+
+    def get_region_range_mask(self):
+        first, last = self.get_region_range_positions()
+        days = np.arange(len(self.dates))
+        return (days >= first[:, None]) & (days <= last[:, None])
+
+    def get_region_range_positions(self):
+        has_data = self.counts > 0
+        first = has_data.argmax(axis=1)
+        last = len(self.dates) - 1 - has_data[:, ::-1].argmax(axis=1)
+        return first, last
+
+    def get_date_ranges(self):
+        """
+        Returns a DataFrame with the first and last day each region has chart data for (indexed by region).
+        """
+        first, last = self.get_region_range_positions()
+        return pd.DataFrame(
+            {"first_date": self.dates[first], "last_date": self.dates[last]},
+            index=self.regions,
+        )
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            counts=self.counts,
+            regions=self.regions.to_numpy(dtype=str),
+            start=np.datetime64(self.dates[0] if len(self.dates) else "NaT", "D"),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["counts"], data["regions"], data["start"].item())
+
+
+def build_chart_coverage():
+    """
+    Builds the coverage index from the partitioned copy of the charts, reading one month at a time.
+    """
+    rank_counts = [
+        charts.astype({"region": str}).groupby(["region", "date"]).size()
+        for _, charts in iter_charts(by="month", columns=["region", "date"])
+    ]
+    return ChartCoverage.from_rank_counts(pd.concat(rank_counts))
+
+
+def store_chart_coverage(coverage: ChartCoverage, source_key: str):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for stale_path in Path(CACHE_DIR).glob("top50_coverage.*.npz"):
+        stale_path.unlink()
+    coverage.save(get_coverage_path(source_key))
+
+
+def get_chart_coverage():
+    """
+    Returns the coverage index (ChartCoverage) of the current version of top50.csv, building it first if necessary.
+    """
+    source_key = get_source_key(get_data_path("top50.csv"))
+    path = get_coverage_path(source_key)
+    if os.path.exists(path):
+        return ChartCoverage.load(path)
+    coverage = build_chart_coverage()
+    store_chart_coverage(coverage, source_key)
+    return coverage
+
+
+def update_chart_coverage(rows: pd.DataFrame, previous_source_key: str):
+    """
+    Adds rows that were just appended to top50.csv to the coverage index.
+
+    previous_source_key is the version of top50.csv before the rows were appended - if there is no coverage index for that version, nothing happens (the index is re-built the next time it is needed).
+    """
+    previous_path = get_coverage_path(previous_source_key)
+    if not os.path.exists(previous_path):
+        return
+    coverage = ChartCoverage.load(previous_path)
+    rank_counts = rows.astype({"region": str}).groupby(["region", "date"]).size()
+    coverage.add(
+        rank_counts.index.get_level_values("region"),
+        rank_counts.index.get_level_values("date"),
+        rank_counts.to_numpy(),
+    )
+    store_chart_coverage(coverage, get_source_key(get_data_path("top50.csv")))
+
+
+def get_missing_chart_jobs(
+    region_code_to_name: dict, chart_size=CHART_SIZE, within_region_range=True
+):
+    """
+    Returns download jobs (see helpers.chart_download) for all (region, date) pairs that are missing or incomplete (less than chart_size ranks) in top50.csv.
+
+    region_code_to_name maps region codes to region names (see helpers.ingest.get_region_code_to_name).
+    """
+    coverage = get_chart_coverage()
+    cells = pd.concat(
+        [
+            coverage.get_missing_cells(within_region_range),
+            coverage.get_incomplete_cells(chart_size),
+        ]
+    ).sort_values(["date", "region"])
+    region_name_to_code = {name: code for code, name in region_code_to_name.items()}
+    codes = cells.region.map(region_name_to_code)
+    unknown = codes.isna().to_numpy()
+    if unknown.any():
+        unknown_regions = ", ".join(map(str, cells.region[unknown].unique()))
+        print(
+            f"skipping {unknown.sum()} charts of regions without code: {unknown_regions}"
+        )
+    return pd.DataFrame(
+        {
+            "code": codes[~unknown].to_numpy(),
+            "date": cells.date[~unknown].to_numpy(),
+        }
+    )
@@ -0,0 +1,191 @@
+"""
+Memory-mapped "cube" of the charts for fast trajectory queries (rank and streams of tracks in all regions, day by day).
+
+The cube has one row per (track, region) pair a track charted in and one column per day. Rows are sorted by track (and region), so the trajectories of a track in all its regions are a contiguous block of rows. Ranks (int8, 0 = not in the charts) and streams (int32, 0 = no data) are stored as .npy files in CHART_CUBE_DIR and memory-mapped, i.e. trajectories are returned as zero-copy NumPy views and only the pages that are actually read are loaded from disk.
+
+The cube is built from the partitioned copy of the charts (see helpers.chunked), one month at a time, and re-built whenever top50.csv changed.
+"""
+
+import json
+import os
+import shutil
+from functools import cache
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from . import DATA_DIR, get_data_path, get_source_key
+from .chunked import (
+    iter_charts,
+    get_chart_dataset_source_key,
+    store_chart_dataset_source_key,
+)
+
+CHART_CUBE_DIR = os.path.join(DATA_DIR, "top50_cube")
+
+CUBE_VALUES = {"rank": np.int8, "streams": np.int32}
+
+
+def build_chart_cube(cube_dir=CHART_CUBE_DIR):
+    """
+    (Re-)builds the chart cube in cube_dir, reading the charts one month at a time.
+    """
+    source_key = get_source_key(get_data_path("top50.csv"))
+    print(f"building chart cube in '{cube_dir}'")
+    # first pass: (track, region) pairs (rows) and days (columns)
+    pairs = []
+    first_date, last_date = None, None
+    for _, charts in iter_charts(by="month", columns=["id", "region", "date"]):
+        pairs.append(charts[["id", "region"]].astype(str).drop_duplicates())
+        first_date = min(first_date or charts.date.min(), charts.date.min())
+        last_date = max(last_date or charts.date.max(), charts.date.max())
+    pairs = (
+        pd.concat(pairs)
+        .drop_duplicates()
+        .sort_values(["id", "region"])
+        .reset_index(drop=True)
+    )
+    n_days = (last_date - first_date).days + 1
+
+    # second pass: fill in the values
+    tmp_dir = f"{cube_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    cube = {
+        value: open_memmap(
+            os.path.join(tmp_dir, f"{value}.npy"),
+            mode="w+",
+            dtype=dtype,
+            shape=(len(pairs), n_days),
+        )
+        for value, dtype in CUBE_VALUES.items()
+    }
+    row_index = pd.MultiIndex.from_frame(pairs)
+    for _, charts in iter_charts(by="month"):
+        rows = row_index.get_indexer(
+            pd.MultiIndex.from_arrays(
+                [charts.id.astype(str), charts.region.astype(str)]
+            )
+        )
+        cols = (charts.date - first_date).dt.days.to_numpy()
+        cube["rank"][rows, cols] = charts["rank"].to_numpy()
+        cube["streams"][rows, cols] = charts.streams.fillna(0).to_numpy()
+    for values in cube.values():
+        values.flush()
+    del cube
+
+    pairs.astype({"region": "category"}).to_parquet(
+        os.path.join(tmp_dir, "pairs.parquet")
+    )
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({"first_date": first_date.strftime("%Y-%m-%d")}, f)
+    store_chart_dataset_source_key(source_key, tmp_dir)
+    shutil.rmtree(cube_dir, ignore_errors=True)
+    os.replace(tmp_dir, cube_dir)
+
+
+class ChartCube:
+    """
+    Read-only view of a chart cube built with build_chart_cube (see the module docstring).
+
+    cube = get_chart_cube()
+    regions, ranks = cube.get_trajectory(track_id)  # ranks[i] is the trajectory of the track in regions[i]
+    """
+
+    def __init__(self, cube_dir=CHART_CUBE_DIR):
+        self.values = {
+            value: np.load(os.path.join(cube_dir, f"{value}.npy"), mmap_mode="r")
+            for value in CUBE_VALUES
+        }
+        pairs = pd.read_parquet(os.path.join(cube_dir, "pairs.parquet"))
+        with open(os.path.join(cube_dir, "meta.json")) as f:
+            meta = json.load(f)
+        # rows are sorted by track, i.e. the rows of each track start where its ID differs from the one before
+        track_ids = pairs.id.to_numpy()
+        starts = np.flatnonzero(
+            np.concatenate([[True], track_ids[1:] != track_ids[:-1]])
+        )
+        self.tracks = pd.Index(track_ids[starts], name="id")
+        self.track_offsets = np.append(starts, len(pairs))
+        self.regions = pd.Index(pairs.region.cat.categories, name="region")
+        # region of each row, as position in regions
+        self.row_region_codes = pairs.region.cat.codes.to_numpy()
+        self.dates = pd.date_range(
+            meta["first_date"],
+            periods=self.values["rank"].shape[1],
+            freq="D",
+            name="date",
+        )
+
+    def get_rows(self, track_id: str):
+        """
+        Returns the slice of rows with the trajectories of the given track.
+        """
+        i = self.tracks.get_loc(track_id)
+        return slice(self.track_offsets[i], self.track_offsets[i + 1])
+
+    def get_date_slice(self, start=None, end=None):
+        return self.dates.slice_indexer(start, end)
+
+    def get_trajectory(self, track_id: str, value="rank", start=None, end=None):
+        """
+        Returns the regions a track charted in and its trajectories in those regions between start and end (inclusive, both optional) as 2D array (one row per region, one column per day, see dates), which is a view of the memory-mapped cube (no data is copied).
+        """
+        rows = self.get_rows(track_id)
+        return (
+            self.regions[self.row_region_codes[rows]],
+            self.values[value][rows, self.get_date_slice(start, end)],
+        )
+
+    def get_trajectories(
+        self, track_ids, value="rank", start=None, end=None, regions=None
+    ):
+        """
+        Returns a dict mapping each of track_ids (that ever charted) to the regions it charted in (as positions in the regions attribute) and its trajectories in those regions (see get_trajectory).
+
+        Without regions, both are views of the cube. If only some regions are requested, the rows of those regions are copied (they are not contiguous).
+        """
+        positions = self.tracks.get_indexer(track_ids)
+        date_slice = self.get_date_slice(start, end)
+        values = self.values[value]
+        if regions is not None:
+            selected_regions = np.zeros(len(self.regions), dtype=bool)
+            region_positions = self.regions.get_indexer(regions)
+            selected_regions[region_positions[region_positions != -1]] = True
+        trajectories = {}
+        for track_id, i in zip(track_ids, positions):
+            if i == -1:
+                continue
+            rows = slice(self.track_offsets[i], self.track_offsets[i + 1])
+            region_codes = self.row_region_codes[rows]
+            track_values = values[rows, date_slice]
+            if regions is not None:
+                selected = selected_regions[region_codes]
+                region_codes, track_values = (
+                    region_codes[selected],
+                    track_values[selected],
+                )
+            trajectories[track_id] = (region_codes, track_values)
+        return trajectories
+
+    def get_trajectory_frame(self, track_id: str, value="rank", start=None, end=None):
+        """
+        Returns the trajectories of a track as DataFrame with one row per region and one column per day (this copies the data).
+        """
+        regions, values = self.get_trajectory(track_id, value, start, end)
+        return pd.DataFrame(
+            values, index=regions, columns=self.dates[self.get_date_slice(start, end)]
+        )
+
+
+@cache
+def load_chart_cube(source_key: str):
+    if get_chart_dataset_source_key(CHART_CUBE_DIR) != source_key:
+        build_chart_cube()
+    return ChartCube()
+
+
+def get_chart_cube():
+    """
+    Returns the chart cube (ChartCube) of the current version of top50.csv, building it first if necessary.
+    """
+    return load_chart_cube(get_source_key(get_data_path("top50.csv")))
@@ -0,0 +1,208 @@
+"""
+Parallel, resumable and checksummed downloads of the files in DATA_DIR.
+
+The expected files are listed in a manifest (data_manifest.json next to environment.yml), e.g.
+
+{
+    "top50.csv": {"url": "https://...", "size": 123456, "sha256": "..."},
+    ...
+}
+
+(write_data_manifest creates it from the files in DATA_DIR). Files listed there are checked for their size and checksum before get_data_path returns them; checksums are only computed again when the size or modification time of a file changes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from tqdm import tqdm
+from . import ROOT_DIR, DATA_DIR, CACHE_DIR, ZIP_CHUNK_SIZE, get_source_key
+
+MANIFEST_PATH = os.path.join(ROOT_DIR, "data_manifest.json")
+
+# checksums of files in DATA_DIR that were already verified, with the size and modification time they had back then
+VERIFIED_FILES_PATH = os.path.join(CACHE_DIR, "verified_data_files.json")
+
+verified_files_lock = threading.Lock()
+
+
+def load_data_manifest(path=MANIFEST_PATH):
+    """
+    Returns the entries of the data manifest (an empty dict if there is none).
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_data_manifest(urls: dict, path=MANIFEST_PATH):
+    """
+    Writes a manifest for the files in DATA_DIR whose names are the keys of urls (the values are the URLs the files can be downloaded from), with their current sizes and checksums.
+    """
+    manifest = load_data_manifest(path)
+    for name, url in urls.items():
+        file_path = os.path.join(DATA_DIR, name)
+        manifest[name] = {
+            "url": url,
+            "size": os.path.getsize(file_path),
+            "sha256": get_file_sha256(file_path),
+        }
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"wrote manifest with {len(manifest)} files to '{path}'")
+
+
+def get_file_sha256(path, chunk_size=ZIP_CHUNK_SIZE):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def load_verified_files():
+    if not os.path.exists(VERIFIED_FILES_PATH):
+        return {}
+    with open(VERIFIED_FILES_PATH) as f:
+        return json.load(f)
+
+
+def store_verified_file(name: str, path, sha256: str):
+    with verified_files_lock:
+        verified_files = load_verified_files()
+        verified_files[name] = {"source_key": get_source_key(path), "sha256": sha256}
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{VERIFIED_FILES_PATH}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(verified_files, f)
+        os.replace(tmp_path, VERIFIED_FILES_PATH)
+
+
+def is_valid_data_file(name: str, entry: dict):
+    """
+    Checks whether the file with the given name in DATA_DIR exists and matches the size and checksum of its manifest entry.
+    """
+    path = os.path.join(DATA_DIR, name)
+    if not os.path.exists(path):
+        return False
+    if "size" in entry and os.path.getsize(path) != entry["size"]:
+        return False
+    if "sha256" not in entry:
+        return True
+    verified = load_verified_files().get(name)
+    if verified is not None and verified["source_key"] == get_source_key(path):
+        sha256 = verified["sha256"]
+    else:
+        sha256 = get_file_sha256(path)
+        store_verified_file(name, path, sha256)
+    return sha256 == entry["sha256"]
+
+
+def fetch_file(
+    url,
+    target_path,
+    size: int = None,
+    sha256: str = None,
+    chunk_size=ZIP_CHUNK_SIZE,
+    progress_position: int = None,
+):
+    """
+    Downloads url to target_path via a .part file which is only renamed to target_path once the download is complete (and has the expected size and sha256 checksum, if given).
+
+    If a .part file is left over from an interrupted download, the download is resumed from where it stopped (using a HTTP Range request).
+    """
+    part_path = f"{target_path}.part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if size is not None and offset > size:
+        offset = 0
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    with requests.get(url, stream=True, headers=headers, timeout=60) as resp:
+        # 416: nothing left to download
+        if not (resp.status_code == 416 and offset > 0):
+            resp.raise_for_status()
+            if resp.status_code != 206:
+                # server doesn't support ranges, start over
+                offset = 0
+            total = offset + int(resp.headers.get("content-length", 0))
+            with open(part_path, "ab" if offset > 0 else "wb") as out, tqdm(
+                desc=os.path.basename(target_path),
+                total=total,
+                initial=offset,
+                unit="iB",
+                unit_scale=True,
+                unit_divisor=1024,
+                position=progress_position,
+            ) as bar:
+                for data in resp.iter_content(chunk_size=chunk_size):
+                    bar.update(out.write(data))
+
+    actual_size = os.path.getsize(part_path)
+    if size is not None and actual_size != size:
+        os.remove(part_path)
+        raise RuntimeError(
+            f"Download of {url} has the wrong size: expected {size}, got {actual_size}"
+        )
+    if sha256 is not None:
+        actual_sha256 = get_file_sha256(part_path)
+        if actual_sha256 != sha256:
+            os.remove(part_path)
+            raise RuntimeError(
+                f"Checksum mismatch for {url}: expected {sha256}, got {actual_sha256}"
+            )
+    os.replace(part_path, target_path)
+
+
+def fetch_data_file(name: str, entry: dict, progress_position: int = None):
+    """
+    Makes sure the file with the given name in DATA_DIR matches its manifest entry, (re-)downloading it if necessary. Returns its path.
+    """
+    path = os.path.join(DATA_DIR, name)
+    if is_valid_data_file(name, entry):
+        return path
+    if os.path.exists(path):
+        print(f"'{name}' doesn't match the data manifest, downloading it again")
+    if "url" not in entry:
+        raise RuntimeError(
+            f"No url for '{name}' in the data manifest, cannot fetch data! Add '{name}' to '{DATA_DIR}' by hand!"
+        )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fetch_file(
+        entry["url"],
+        path,
+        size=entry.get("size"),
+        sha256=entry.get("sha256"),
+        progress_position=progress_position,
+    )
+    if "sha256" in entry:
+        store_verified_file(name, path, entry["sha256"])
+    return path
+
+
+def fetch_data_files(names=None, max_workers=4, manifest=None):
+    """
+    Downloads all files of the data manifest (or only those with the given names) that are missing or invalid, max_workers at a time.
+
+    Interrupted downloads are resumed the next time this is called.
+    """
+    manifest = load_data_manifest() if manifest is None else manifest
+    names = list(manifest) if names is None else list(names)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                fetch_data_file, name, manifest[name], i % max_workers
+            ): name
+            for i, name in enumerate(names)
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"fetching '{futures[future]}' failed: {e}")
+                failed.append(futures[future])
+    if failed:
+        raise RuntimeError(f"Could not fetch {', '.join(failed)}")
+    print(f"all {len(names)} files are available in '{DATA_DIR}'")
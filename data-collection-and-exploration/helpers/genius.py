@@ -0,0 +1,262 @@
+"""
+Concurrent fetching of song data (incl. lyrics) from Genius, with bounded retries and a persistent cache of results.
+
+Songs are searched by (title, artist) with lyricsgenius. Its calls are blocking, so they run in a thread pool, driven by a pool of asyncio workers (max_concurrency songs in flight, at most requests_per_second searches started per second). Transient errors (timeouts, connection errors, 429 and 5xx responses) are retried with capped exponential backoff; songs that still fail are reported and simply tried again in the next run.
+
+Results are cached in a helpers.checkpoint.CheckpointStore keyed on title and artist. Searches that found nothing are cached as well (as None), so re-crawls don't ask Genius about them again.
+
+Authentication uses the GENIUS_ACCESS_TOKEN environment variable (see https://genius.com/api-clients).
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+from lyricsgenius import Genius
+from .async_http import (
+    TokenBucket,
+    RetriesExhaustedError,
+    get_backoff_delay,
+    run_coroutine,
+)
+from .checkpoint import CheckpointStore
+
+GENIUS_CACHE_NAME = "genius_songs"
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def get_song_key(title: str, artist: str):
+    return f"{title}\t{artist}"
+
+
+class GeniusResponseError(Exception):
+    def __init__(self, status: int, url: str):
+        super().__init__(f"Genius responded with {status} for {url}")
+        self.status = status
+
+
+def raise_for_status(resp: requests.Response, *args, **kwargs):
+    # lyricsgenius doesn't raise proper errors for error responses (only AssertionErrors), so we can't tell which ones are worth retrying otherwise
+    if resp.status_code >= 400:
+        raise GeniusResponseError(resp.status_code, resp.url)
+
+
+class GeniusFetchStats:
+    """
+    Throughput metrics of a GeniusFetcher run.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.cached = 0
+        self.found = 0
+        self.not_found = 0
+        self.failed = 0
+        self.requests = 0
+        self.retries = 0
+
+    @property
+    def fetched(self):
+        return self.found + self.not_found
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def songs_per_second(self):
+        return self.fetched / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.fetched} songs fetched in {self.elapsed:.1f}s ({self.songs_per_second():.2f} songs/s): "
+            f"{self.found} found, {self.not_found} not found, {self.failed} failed, {self.cached} cached "
+            f"({self.requests} searches, {self.retries} retries)"
+        )
+
+
+def is_retryable(error: Exception):
+    if isinstance(
+        error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+    ):
+        return True
+    if isinstance(error, GeniusResponseError):
+        return error.status in RETRY_STATUS_CODES
+    return False
+
+
+class GeniusFetcher:
+    """
+    Searches lots of songs on Genius concurrently, see the module docstring.
+
+    api_root and web_root can be pointed to a local fake Genius server for testing (lyrics are scraped from web_root + the path of the song URL, i.e. the fake server should return song URLs starting with https://genius.com/).
+
+    fetcher = GeniusFetcher(store)
+    fetcher.fetch([("Blinding Lights", "The Weeknd"), ...])
+    print(fetcher.stats)
+    """
+
+    def __init__(
+        self,
+        store: CheckpointStore,
+        access_token: str = None,
+        max_concurrency: int = 8,
+        requests_per_second: float = 5,
+        max_retries: int = 5,
+        timeout: float = 15,
+        api_root: str = None,
+        web_root: str = None,
+    ):
+        self.access_token = access_token or os.getenv("GENIUS_ACCESS_TOKEN")
+        if not self.access_token:
+            raise RuntimeError(
+                "No Genius API token found! Generate it from https://genius.com/api-clients and set GENIUS_ACCESS_TOKEN (e.g. in a .env file)"
+            )
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.api_root = api_root
+        self.web_root = web_root
+        self.stats = GeniusFetchStats()
+
+    def create_client(self):
+        # retries and rate limiting are done by the fetcher, not by lyricsgenius
+        genius = Genius(
+            self.access_token,
+            timeout=self.timeout,
+            sleep_time=0,
+            retries=0,
+            remove_section_headers=True,
+        )
+        genius.verbose = False
+        genius._session.hooks["response"].append(raise_for_status)
+        if self.api_root is not None:
+            genius.API_ROOT = self.api_root.rstrip("/") + "/"
+            genius.PUBLIC_API_ROOT = genius.API_ROOT
+        if self.web_root is not None:
+            genius.WEB_ROOT = self.web_root.rstrip("/") + "/"
+        return genius
+
+    async def search_song(self, genius: Genius, executor, title: str, artist: str):
+        """
+        Returns the song data for title and artist (None if Genius has no match), retrying transient errors up to max_retries times.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            self.stats.requests += 1
+            try:
+                song = await loop.run_in_executor(
+                    executor,
+                    lambda: genius.search_song(title, artist, get_full_info=True),
+                )
+                return song.to_dict() if song is not None else None
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self.stats.retries += 1
+                delay = get_backoff_delay(attempt)
+                if isinstance(e, GeniusResponseError) and e.status == 429:
+                    # all workers back off, not just this one
+                    self.rate_limiter.pause(delay)
+                await asyncio.sleep(delay)
+        raise RetriesExhaustedError(
+            f"searching '{title}' by '{artist}' failed after {self.max_retries + 1} attempts"
+        )
+
+    async def worker(self, queue: asyncio.Queue, executor):
+        # each worker has its own client (and thus its own HTTP session)
+        genius = self.create_client()
+        while True:
+            title, artist = await queue.get()
+            try:
+                song = await self.search_song(genius, executor, title, artist)
+            except Exception as e:
+                self.stats.failed += 1
+                print(f"searching '{title}' by '{artist}' failed: {e}")
+            else:
+                self.store.add([get_song_key(title, artist)], [song])
+                if song is None:
+                    self.stats.not_found += 1
+                else:
+                    self.stats.found += 1
+            finally:
+                queue.task_done()
+
+    async def report_progress(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.stats)
+
+    async def fetch_async(self, songs, report_every: float = 60):
+        """
+        Searches all (title, artist) pairs in songs that are not cached yet, printing the throughput metrics every report_every seconds.
+        """
+        self.stats = GeniusFetchStats()
+        songs = list(dict.fromkeys(songs))
+        missing = [
+            (title, artist)
+            for title, artist in songs
+            if get_song_key(title, artist) not in self.store
+        ]
+        self.stats.cached += len(songs) - len(missing)
+        print(f"{len(songs) - len(missing)} of {len(songs)} songs already cached")
+        if not missing:
+            return
+        self.rate_limiter = TokenBucket(self.requests_per_second)
+        queue = asyncio.Queue()
+        for song in missing:
+            queue.put_nowait(song)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            workers = [
+                asyncio.create_task(self.worker(queue, executor))
+                for _ in range(self.max_concurrency)
+            ]
+            reporter = asyncio.create_task(self.report_progress(report_every))
+            await queue.join()
+            reporter.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        print(self.stats)
+
+    def fetch(self, songs, **kwargs):
+        """
+        Synchronous wrapper around fetch_async (for use in scripts and notebooks).
+        """
+        return run_coroutine(self.fetch_async(songs, **kwargs))
+
+
+def fetch_genius_songs(
+    songs: pd.DataFrame, store_name=GENIUS_CACHE_NAME, **fetcher_kwargs
+):
+    """
+    Fetches Genius song data for every row of songs (with title and artist columns) that isn't cached yet, and returns the other columns of those rows joined with the song data (rows without a match on Genius are left out).
+
+    fetcher_kwargs are passed on to GeniusFetcher.
+    """
+    songs = songs[songs.title.apply(lambda title: isinstance(title, str))]
+    store = CheckpointStore(store_name)
+    try:
+        fetcher = GeniusFetcher(store, **fetcher_kwargs)
+        pairs = list(zip(songs.title, songs.artist))
+        fetcher.fetch(pairs)
+        keys = [get_song_key(title, artist) for title, artist in pairs]
+        # songs that failed aren't in the store
+        cached_keys = [key for key in dict.fromkeys(keys) if key in store]
+        results = dict(zip(cached_keys, store.values(cached_keys)))
+    finally:
+        store.close()
+    found = [results.get(key) is not None for key in keys]
+    return pd.concat(
+        [
+            # title and artist are part of the song data
+            songs[found].drop(columns=["title", "artist"]).reset_index(drop=True),
+            pd.DataFrame([results[key] for key, ok in zip(keys, found) if ok]),
+        ],
+        axis=1,
+    )
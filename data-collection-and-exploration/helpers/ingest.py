@@ -0,0 +1,240 @@
+"""
+Incremental ingestion of new daily charts into top50.csv.
+
+A watermark of the (region, date) pairs that are already in top50.csv is kept next to the parquet caches, so new chart data can be appended without re-building (or even reading) the whole chart table.
+"""
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+from . import (
+    CACHE_DIR,
+    get_data_path,
+    get_source_key,
+    read_parquet,
+    write_parquet,
+    get_charts,
+    get_country_data,
+)
+from .chunked import append_partitioned_charts
+from .coverage import update_chart_coverage
+
+CHART_COLUMNS = ["region", "date", "rank", "streams", "id"]
+
+SCRAPED_CHART_FILE_PATTERN = re.compile(
+    r"regional-(?P<code>[a-z]+)-daily-(?P<date>\d{4}-\d{2}-\d{2})\.csv"
+)
+
+
+def get_watermark_path(charts_path):
+    return os.path.join(
+        CACHE_DIR, f"top50_watermark.{get_source_key(charts_path)}.parquet"
+    )
+
+
+def get_chart_watermark():
+    """
+    Returns a DataFrame with all (region, date) pairs that are in top50.csv.
+
+    The watermark is updated by append_chart_rows; if top50.csv was changed by other means, it is re-built from the chart data.
+    """
+    charts_path = get_data_path("top50.csv")
+    watermark_path = get_watermark_path(charts_path)
+    if os.path.exists(watermark_path):
+        return read_parquet(watermark_path)
+    watermark = (
+        get_charts()[["region", "date"]].drop_duplicates().reset_index(drop=True)
+    )
+    store_chart_watermark(watermark, charts_path)
+    return watermark
+
+
+def store_chart_watermark(watermark: pd.DataFrame, charts_path):
+    for stale_path in Path(CACHE_DIR).glob("top50_watermark.*.parquet"):
+        stale_path.unlink()
+    watermark = watermark.astype({"region": "category"})
+    write_parquet(watermark.reset_index(drop=True), get_watermark_path(charts_path))
+
+
+def is_in_watermark(watermark: pd.DataFrame, regions, dates):
+    """
+    Returns a boolean array telling for each (region, date) pair whether it is already in the watermark.
+    """
+    loaded = pd.MultiIndex.from_arrays(
+        [watermark.region.astype(str), pd.to_datetime(watermark.date)]
+    )
+    return pd.MultiIndex.from_arrays(
+        [pd.Series(regions).astype(str), pd.to_datetime(pd.Series(dates))]
+    ).isin(loaded)
+
+
+def append_chart_rows(rows: pd.DataFrame):
+    """
+    Appends the rows for all (region, date) pairs of rows that are not in top50.csv yet to top50.csv (days that are already there are ignored).
+
+    The partitioned copy of the charts (see helpers.chunked) and the coverage index (see helpers.coverage) are updated as well.
+
+    Returns the rows that were actually appended.
+    """
+    charts_path = get_data_path("top50.csv")
+    watermark = get_chart_watermark()
+    rows = rows[CHART_COLUMNS].copy()
+    rows["date"] = pd.to_datetime(rows.date)
+    new_rows = rows[~is_in_watermark(watermark, rows.region, rows.date)]
+    if len(new_rows) == 0:
+        return new_rows
+
+    previous_source_key = get_source_key(charts_path)
+    with open(charts_path, "rb+") as f:
+        header = f.readline().decode().strip().split(",")
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+    new_rows.sort_values(["region", "date", "rank"])[header].to_csv(
+        charts_path, mode="a", header=False, index=False, date_format="%Y-%m-%d"
+    )
+    store_chart_watermark(
+        pd.concat(
+            [watermark, new_rows[["region", "date"]].drop_duplicates()],
+            ignore_index=True,
+        ),
+        charts_path,
+    )
+    append_partitioned_charts(new_rows, previous_source_key)
+    update_chart_coverage(new_rows, previous_source_key)
+    get_charts.cache_clear()
+    print(
+        f"appended {len(new_rows)} chart rows",
+        f"({len(new_rows[['region', 'date']].drop_duplicates())} new region/date pairs)",
+    )
+    return new_rows
+
+
+def get_region_code_to_name():
+    """
+    Returns a dict mapping the region codes used by Spotify (lowercase ISO alpha-2 codes and 'global') to the region names used in top50.csv.
+    """
+    country_data = get_country_data()
+    return {
+        "global": "Global",
+        **{
+            str(code).lower(): str(name)
+            for name, code in country_data.iso_alpha2.items()
+        },
+    }
+
+
+def find_scraped_chart_files(folder, region_code_to_name):
+    """
+    Returns a DataFrame with path, region and date of every chart CSV downloaded from charts.spotify.com (regional-<code>-daily-<date>.csv) in folder.
+
+    region_code_to_name maps region codes to region names (see get_region_code_to_name).
+    """
+    files = []
+    for file_name in os.listdir(folder):
+        match = SCRAPED_CHART_FILE_PATTERN.fullmatch(file_name)
+        if match is not None:
+            files.append(
+                {
+                    "path": os.path.join(folder, file_name),
+                    "region": region_code_to_name.get(match["code"]),
+                    "date": pd.Timestamp(match["date"]),
+                }
+            )
+    return pd.DataFrame(files, columns=["path", "region", "date"])
+
+
+def read_scraped_chart_files(files):
+    """
+    Reads the chart CSVs downloaded from charts.spotify.com given as (path, region, date) tuples and returns the top 50 of each of them in the format of top50.csv, as a single pyarrow Table.
+    """
+    tables = []
+    for path, region, date in files:
+        table = pv.read_csv(
+            path,
+            convert_options=pv.ConvertOptions(
+                include_columns=["rank", "uri", "streams"],
+                # streams may be written as floats (e.g. 1234.0), they are cast to ints below
+                column_types={
+                    "rank": pa.int64(),
+                    "uri": pa.string(),
+                    "streams": pa.float64(),
+                },
+            ),
+        )
+        table = table.filter(pc.less_equal(table["rank"], 50))
+        tables.append(
+            table.append_column(
+                "region", pa.array([region] * table.num_rows, pa.string())
+            ).append_column(
+                "date",
+                pa.array([pd.Timestamp(date)] * table.num_rows, pa.timestamp("s")),
+            )
+        )
+    table = pa.concat_tables(tables)
+    return pa.table(
+        {
+            "region": table["region"],
+            "date": table["date"],
+            "rank": table["rank"],
+            "streams": table["streams"].cast(pa.int64()),
+            "id": pc.replace_substring(table["uri"], "spotify:track:", ""),
+        }
+    )
+
+
+def read_scraped_chart_files_parallel(
+    files: pd.DataFrame, max_workers: int = None, files_per_task=500
+):
+    """
+    Reads the chart CSVs in files (see find_scraped_chart_files) with read_scraped_chart_files, spreading them across max_workers processes (all cores by default) in batches of files_per_task files. Returns all rows as a single DataFrame in the format of top50.csv.
+    """
+    files = list(files[["path", "region", "date"]].itertuples(index=False, name=None))
+    batches = [
+        files[i : i + files_per_task] for i in range(0, len(files), files_per_task)
+    ]
+    if len(batches) == 1:
+        # not worth starting any processes
+        tables = [read_scraped_chart_files(batches[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            tables = list(executor.map(read_scraped_chart_files, batches))
+    rows = pa.concat_tables(tables).to_pandas()
+    rows["region"] = rows.region.astype("category")
+    return rows
+
+
+def ingest_scraped_chart_files(folder, region_code_to_name, max_workers: int = None):
+    """
+    Appends the data of all chart CSVs in folder whose (region, date) is not in top50.csv yet, in a single bulk write. Files for days that are already loaded are not even read, the others are parsed in parallel (see read_scraped_chart_files_parallel).
+
+    Returns the rows that were appended.
+    """
+    files = find_scraped_chart_files(folder, region_code_to_name)
+    unknown_regions = files.loc[files.region.isna(), "path"]
+    if len(unknown_regions) > 0:
+        print(f"skipping {len(unknown_regions)} files of unknown regions")
+        files = files[files.region.notna()]
+    files = files[~is_in_watermark(get_chart_watermark(), files.region, files.date)]
+    if len(files) == 0:
+        print("no new chart data")
+        return pd.DataFrame(columns=CHART_COLUMNS)
+    print(f"reading {len(files)} chart files")
+    rows = read_scraped_chart_files_parallel(files, max_workers)
+    # Spotify doesn't have complete charts for every day (nothing we can do about that)
+    track_counts = rows.groupby(["region", "date"], observed=True).size()
+    if (track_counts < 50).any():
+        print(f"{(track_counts < 50).sum()} charts have less than 50 tracks")
+    return append_chart_rows(rows)
+
+
+def get_unseen_ids(ids, store):
+    """
+    Returns the unique IDs in ids that are not in the given CheckpointStore (i.e. whose metadata has not been fetched yet).
+    """
+    return store.missing(dict.fromkeys(ids))
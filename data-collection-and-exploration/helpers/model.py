@@ -1,9 +1,15 @@
-from functools import cache
-from . import get_track_data, get_countries_charts
+from . import get_track_data, get_countries_charts, disk_cache
+from .chart_index import (
+    get_track_region_index,
+    build_track_region_matrix,
+    get_track_region_matrix,
+    get_tracks_charting_only_in_one,
+    get_subregion_to_region,
+)
 import pandas as pd
 
 
-@cache
+@disk_cache(sources=("top50_track_data.csv",), depends_on=(get_track_data,))
 def get_basic_track_features():
     tracks = get_track_data()
     isrc_cols = tracks.columns[tracks.columns.str.contains("isrc")].tolist()
@@ -18,21 +24,35 @@ def get_basic_track_features():
     return track_feats
 
 
-countries_charts = get_countries_charts()
-track_feats = get_basic_track_features()
+# the full datasets used to be loaded eagerly as module-level variables - keep them available under the same names,
+# but only load them when they are actually accessed (importing this module should be cheap)
+lazy_datasets = {
+    "countries_charts": get_countries_charts,
+    "track_feats": get_basic_track_features,
+}
 
 
-@cache
+def __getattr__(name):
+    if name in lazy_datasets:
+        return lazy_datasets[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@disk_cache(
+    depends_on=(
+        get_track_region_index,
+        get_track_region_matrix,
+        build_track_region_matrix,
+        get_tracks_charting_only_in_one,
+        get_basic_track_features,
+    )
+)
 def get_track_feature_region_dataset():
     """
     Returns a dataframe with the track features for each track that only charted in one region. Oceania is removed because of low number of observations.
     """
-    charting_tracks_by_region = countries_charts.drop_duplicates(
-        subset=["id", "geo_region"]
-    )[["id", "geo_region"]].rename(columns={"geo_region": "region"})
-    tracks_charting_only_in_one_region = charting_tracks_by_region[
-        ~charting_tracks_by_region.duplicated(keep=False, subset=["id"])
-    ].reset_index(drop=True)
+    track_feats = get_basic_track_features()
+    tracks_charting_only_in_one_region = get_tracks_charting_only_in_one("region")
     region_tracks_features = pd.merge(
         track_feats, tracks_charting_only_in_one_region, on="id"
     ).set_index("id")
@@ -45,20 +65,30 @@ def get_track_feature_region_dataset():
     return region_track_feats_dataset
 
 
-@cache
+@disk_cache(
+    depends_on=(
+        get_track_region_index,
+        get_track_region_matrix,
+        build_track_region_matrix,
+        get_tracks_charting_only_in_one,
+        get_subregion_to_region,
+        get_basic_track_features,
+    )
+)
 def get_track_feature_subregion_dataset():
     """
     Returns a dataframe with the track features for each track that only charted in one out of four hand-picked subregion
      (Western Europe, Northern America, Eastern Asia, or Latin America and the Caribbean).
     """
-    charting_tracks_by_subregion = countries_charts.drop_duplicates(
-        subset=["id", "geo_subregion"]
-    )[["id", "geo_region", "geo_subregion"]].rename(
-        columns={"geo_region": "region", "geo_subregion": "subregion"}
+    track_feats = get_basic_track_features()
+    tracks_charting_only_in_one_subregion = get_tracks_charting_only_in_one("subregion")
+    tracks_charting_only_in_one_subregion.insert(
+        1,
+        "region",
+        tracks_charting_only_in_one_subregion.subregion.map(get_subregion_to_region())
+        .astype(str)
+        .astype("category"),
     )
-    tracks_charting_only_in_one_subregion = charting_tracks_by_subregion[
-        ~charting_tracks_by_subregion.duplicated(keep=False, subset="id")
-    ].reset_index(drop=True)
     subregion_tracks_features = pd.merge(
         track_feats, tracks_charting_only_in_one_subregion, on="id"
     ).set_index("id")
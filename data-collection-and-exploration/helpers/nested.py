@@ -0,0 +1,105 @@
+"""
+Reading and writing columns with nested values (e.g. lists of genres or Spotify artist/image objects) in CSV files.
+
+Older versions of the crawlers wrote such columns as Python reprs (parsed with ast.literal_eval, which is really slow), newer ones write JSON. parse_nested_column handles both.
+"""
+
+import json
+import re
+from ast import literal_eval
+import numpy as np
+import pandas as pd
+
+# string literals (single- or double-quoted, possibly containing escape sequences) and the Python constants that differ from their JSON counterparts
+PYTHON_LITERAL_TOKEN = re.compile(
+    r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|\b(?:True|False|None|nan|inf)\b"""
+)
+
+PYTHON_TO_JSON_CONSTANTS = {
+    "True": "true",
+    "False": "false",
+    "None": "null",
+    "nan": "NaN",
+    "inf": "Infinity",
+}
+
+
+def python_token_to_json(match):
+    token = match.group()
+    if token in PYTHON_TO_JSON_CONSTANTS:
+        return PYTHON_TO_JSON_CONSTANTS[token]
+    if "\\" in token:
+        # escape sequences differ between Python and JSON, let Python figure out what the string actually is
+        return json.dumps(literal_eval(token), ensure_ascii=False)
+    if token[0] == "'":
+        return '"' + token[1:-1].replace('"', '\\"') + '"'
+    return token
+
+
+def python_repr_to_json(text: str):
+    """
+    Converts the repr of (nested) Python lists, dicts, strings, numbers, booleans and None to JSON.
+    """
+    return PYTHON_LITERAL_TOKEN.sub(python_token_to_json, text)
+
+
+def parse_nested_value(text: str):
+    """
+    Parses a single JSON or Python repr value (for use as converter in pd.read_csv - parse_nested_column is much faster for whole columns, though).
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return literal_eval(text)
+
+
+def parse_nested_column(values):
+    """
+    Parses a column of JSON or Python repr strings (as written by older versions of the crawlers) in bulk. Missing values stay missing.
+
+    Instead of calling a parser for every cell, all cells are joined into one big JSON array (after converting Python reprs to JSON with a single regex pass) that is parsed in one go by the (C-implemented) json module.
+    """
+    values = pd.Series(values)
+    present = values.notna().to_numpy()
+    texts = values[present].astype(str).tolist()
+    joined = "[" + ",".join(texts) + "]"
+    try:
+        parsed = json.loads(joined)
+    except ValueError:
+        try:
+            parsed = json.loads(python_repr_to_json(joined))
+        except ValueError:
+            # should not happen, but just in case the regex does not understand something
+            parsed = [literal_eval(text) for text in texts]
+    if len(parsed) != len(texts):
+        # a cell contained something that is not a single value (e.g. "1, 2")
+        parsed = [parse_nested_value(text) for text in texts]
+
+    result = np.full(len(values), np.nan, dtype=object)
+    for i, value in zip(np.flatnonzero(present), parsed):
+        result[i] = value
+    return pd.Series(result, index=values.index, name=values.name)
+
+
+def read_csv_with_nested_columns(path, nested_columns, **read_csv_kwargs):
+    """
+    Reads a CSV file with pd.read_csv and parses the nested_columns with parse_nested_column.
+    """
+    df = pd.read_csv(path, **read_csv_kwargs)
+    for col in nested_columns:
+        df[col] = parse_nested_column(df[col])
+    return df
+
+
+def encode_nested_columns(df: pd.DataFrame):
+    """
+    Returns a copy of df in which all list or dict values are encoded as JSON (so that they can be written to CSV and parsed again quickly).
+    """
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        is_nested = df[col].map(lambda value: isinstance(value, (list, dict)))
+        if is_nested.any():
+            df.loc[is_nested, col] = df.loc[is_nested, col].map(
+                lambda value: json.dumps(value, ensure_ascii=False)
+            )
+    return df
@@ -0,0 +1,524 @@
+"""
+Low-latency predictions of the region KNN classifiers trained in data_modeling/classification_of_area_track_charted_in (best_std_knn.joblib and best_pca_knn.joblib), outside of the notebook.
+
+The model files are skops archives (an uncompressed zip of .npy files plus a schema.json describing the pipeline). Instead of unpickling them with skops (which copies every array into memory and only works with the scikit-learn version the models were trained with), the fitted parameters are read from the schema and the arrays - most importantly the training points of the KNN - are memory-mapped straight out of the zip. The scaling/PCA steps are applied with NumPy and the neighbors are looked up in a KDTree built over the memory-mapped training points (with the metric and leaf size of the trained model) or, if the training points have too many dimensions for a tree to pay off, by brute force in chunks - either way, predictions are the same as the ones of the pipeline.
+
+Requests can be sent through a MicroBatcher (function API, queries from many threads are combined into batches) or through a small local HTTP server (serve_region_classifier), both of which report p50/p99 latencies.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import cdist
+from sklearn.neighbors import KDTree
+from . import ROOT_DIR
+from .model import get_basic_track_features
+
+MODEL_DIR = os.path.join(
+    ROOT_DIR, "data_modeling", "classification_of_area_track_charted_in"
+)
+
+# with algorithm="auto", training points with more dimensions than this are searched by brute force
+# (with ~10k training points, a KDTree only prunes enough to be faster than computing all distances in few dimensions)
+MAX_TREE_DIMENSIONS = 10
+
+# number of distances computed at once when searching by brute force (bounds the memory used by big batches)
+BRUTE_FORCE_CHUNK_SIZE = 2**23
+
+# scipy names of the metrics of the models
+CDIST_METRICS = {
+    "manhattan": "cityblock",
+    "euclidean": "euclidean",
+    "chebyshev": "chebyshev",
+}
+
+
+def open_stored_array(path, member: str):
+    """
+    Memory-maps the .npy file member of the zip file at path (which has to be stored uncompressed, like skops does).
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(member)
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{member} in {path} is compressed, it can't be memory-mapped")
+    with open(path, "rb") as f:
+        # the data of a member starts after its local file header (30 bytes + file name + extra field)
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(f.read(4), dtype="<u2")
+        f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+        version = np.lib.format.read_magic(f)
+        read_header = (
+            np.lib.format.read_array_header_1_0
+            if version == (1, 0)
+            else np.lib.format.read_array_header_2_0
+        )
+        shape, fortran_order, dtype = read_header(f)
+        offset = f.tell()
+    if dtype.hasobject:
+        raise ValueError(f"{member} in {path} contains Python objects")
+    if len(shape) == 0:
+        with zipfile.ZipFile(path) as archive, archive.open(member) as f:
+            return np.load(f)[()]
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=offset,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+def read_skops_node(path, node: dict):
+    """
+    Turns a node of the schema.json of a skops file into plain Python values: arrays are memory-mapped (see open_stored_array), objects (e.g. estimators) become dicts with their attributes and a __class__ entry.
+    """
+    loader = node["__loader__"]
+    if loader == "JsonNode":
+        return json.loads(node["content"])
+    if loader == "NdArrayNode":
+        if "file" in node:
+            return open_stored_array(path, node["file"])
+        return np.array([read_skops_node(path, item) for item in node["content"]])
+    if loader == "DictNode":
+        return {
+            key: read_skops_node(path, value) for key, value in node["content"].items()
+        }
+    if loader == "ListNode":
+        return [read_skops_node(path, item) for item in node["content"]]
+    if loader == "TupleNode":
+        return tuple(read_skops_node(path, item) for item in node["content"])
+    if loader == "ObjectNode":
+        if node["content"]["__loader__"] != "DictNode":
+            # state that isn't a dict of attributes (e.g. the pickled KDTree of the model) isn't needed
+            return {"__class__": node["__class__"]}
+        return {
+            "__class__": node["__class__"],
+            **read_skops_node(path, node["content"]),
+        }
+    raise ValueError(f"Unsupported node in {path}: {loader} ({node['__class__']})")
+
+
+def read_skops_pipeline(path):
+    with zipfile.ZipFile(path) as archive:
+        schema = json.loads(archive.read("schema.json"))
+    pipeline = read_skops_node(path, schema)
+    if pipeline["__class__"] != "Pipeline":
+        raise ValueError(f"{path} doesn't contain a Pipeline")
+    return [step for _, step in pipeline["steps"]]
+
+
+def get_transform(step: dict):
+    """
+    Returns a function applying a fitted preprocessing step (as read by read_skops_node) to a 2D array.
+    """
+    if step["__class__"] == "StandardScaler":
+        mean = step["mean_"] if step["with_mean"] else 0.0
+        scale = step["scale_"] if step["with_std"] else 1.0
+        return lambda X: (X - mean) / scale
+    if step["__class__"] == "MinMaxScaler":
+        return lambda X: X * step["scale_"] + step["min_"]
+    if step["__class__"] == "PCA":
+        components = np.asarray(step["components_"]).T
+        if step["whiten"]:
+            components = components / np.sqrt(step["explained_variance_"])
+        return lambda X: (X - step["mean_"]) @ components
+    raise ValueError(f"Unsupported pipeline step: {step['__class__']}")
+
+
+class RegionClassifier:
+    """
+    KNN region classifier read from a skops model file (see the module docstring).
+
+    classifier = load_region_classifier("best_pca_knn")
+    classifier.predict(track_feats)  # DataFrame with the predicted region and the probability of each region
+    """
+
+    def __init__(self, model_path, algorithm="auto"):
+        *preprocessing, knn = read_skops_pipeline(model_path)
+        if knn["__class__"] != "KNeighborsClassifier":
+            raise ValueError(f"{model_path} doesn't contain a KNN classifier")
+        self.feature_names = pd.Index(preprocessing[0]["feature_names_in_"])
+        self.transforms = [get_transform(step) for step in preprocessing]
+        self.classes = pd.Index(knn["classes_"], name="region")
+        self.n_neighbors = int(knn["n_neighbors"])
+        self.weights = knn["weights"]
+        # class of each training point (as position in classes)
+        self.labels = knn["_y"]
+        self.training_points = knn["_fit_X"]
+        self.metric = knn["effective_metric_"]
+        self.metric_params = knn["effective_metric_params_"]
+        if algorithm == "auto":
+            algorithm = (
+                "kd_tree"
+                if self.training_points.shape[1] <= MAX_TREE_DIMENSIONS
+                else "brute"
+            )
+        self.algorithm = algorithm
+        self.tree = (
+            KDTree(
+                self.training_points,
+                leaf_size=knn["leaf_size"],
+                metric=self.metric,
+                **self.metric_params,
+            )
+            if algorithm == "kd_tree"
+            else None
+        )
+
+    def get_features(self, track_feats: pd.DataFrame):
+        return track_feats[self.feature_names].to_numpy(dtype=np.float64)
+
+    def query(self, X: np.ndarray):
+        """
+        Returns the distances to the n_neighbors nearest training points and their positions (one row per row of X, which is already transformed).
+        """
+        if self.tree is not None:
+            return self.tree.query(X, k=self.n_neighbors)
+        chunk_size = max(1, BRUTE_FORCE_CHUNK_SIZE // len(self.training_points))
+        distances, neighbors = [], []
+        for start in range(0, len(X), chunk_size):
+            chunk_distances = cdist(
+                X[start : start + chunk_size],
+                self.training_points,
+                CDIST_METRICS.get(self.metric, self.metric),
+                **self.metric_params,
+            )
+            chunk_neighbors = np.argpartition(
+                chunk_distances, self.n_neighbors - 1, axis=1
+            )[:, : self.n_neighbors]
+            distances.append(
+                np.take_along_axis(chunk_distances, chunk_neighbors, axis=1)
+            )
+            neighbors.append(chunk_neighbors)
+        if not distances:
+            return np.zeros((0, self.n_neighbors)), np.zeros((0, self.n_neighbors), int)
+        return np.concatenate(distances), np.concatenate(neighbors)
+
+    def predict_proba(self, X: np.ndarray):
+        """
+        Returns the probability of each class (columns, see classes) for each row of X (features in the order of feature_names), like KNeighborsClassifier.predict_proba.
+        """
+        for transform in self.transforms:
+            X = transform(X)
+        distances, neighbors = self.query(X)
+        if self.weights == "distance":
+            # like scikit-learn: neighbors at distance 0 get all the weight
+            with np.errstate(divide="ignore"):
+                weights = 1.0 / distances
+            exact_matches = np.isinf(weights)
+            exact_rows = exact_matches.any(axis=1)
+            weights[exact_rows] = exact_matches[exact_rows]
+        else:
+            weights = np.ones_like(distances)
+        neighbor_labels = self.labels[neighbors]
+        probabilities = np.stack(
+            [
+                (weights * (neighbor_labels == i)).sum(axis=1)
+                for i in range(len(self.classes))
+            ],
+            axis=1,
+        )
+        normalizer = probabilities.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0] = 1
+        return probabilities / normalizer
+
+    def predict(self, track_feats: pd.DataFrame, batch_size=4096, max_workers=None):
+        """
+        Returns a DataFrame (with the index of track_feats) with the predicted region and the probability of each region for every track.
+
+        Tracks are predicted batch_size at a time, in max_workers threads (the neighbor searches release the GIL).
+        """
+        X = self.get_features(track_feats)
+        batches = [
+            X[start : start + batch_size] for start in range(0, len(X), batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers) as executor:
+            probabilities = list(executor.map(self.predict_proba, batches))
+        probabilities = (
+            np.concatenate(probabilities)
+            if probabilities
+            else np.zeros((0, len(self.classes)))
+        )
+        predictions = pd.DataFrame(
+            probabilities, index=track_feats.index, columns=self.classes
+        )
+        predictions.insert(
+            0,
+            "region",
+            pd.Categorical.from_codes(
+                probabilities.argmax(axis=1), categories=self.classes
+            ),
+        )
+        return predictions
+
+
+@cache
+def load_region_classifier(model_name="best_std_knn", algorithm="auto"):
+    """
+    Returns the classifier of the model file model_name.joblib in MODEL_DIR (loaded only once).
+
+    algorithm is "kd_tree", "brute" or "auto" (a KDTree if the training points have at most MAX_TREE_DIMENSIONS dimensions, brute force otherwise).
+    """
+    return RegionClassifier(os.path.join(MODEL_DIR, f"{model_name}.joblib"), algorithm)
+
+
+def predict_track_regions(model_name="best_std_knn", **predict_kwargs):
+    """
+    Returns the predictions of the given model (see RegionClassifier.predict) for all tracks of top50_track_data.csv with complete features, indexed by track ID.
+    """
+    track_feats = get_basic_track_features()
+    return load_region_classifier(model_name).predict(track_feats, **predict_kwargs)
+
+
+class LatencyStats:
+    """
+    Latencies of the last max_samples requests (thread-safe).
+    """
+
+    def __init__(self, max_samples=100000):
+        self.latencies = deque(maxlen=max_samples)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+
+    def record_batch(self, latencies):
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.requests += len(latencies)
+            self.batches += 1
+
+    def get_percentiles(self, percentiles=(50, 99)):
+        with self.lock:
+            latencies = np.array(self.latencies)
+        if len(latencies) == 0:
+            return {p: None for p in percentiles}
+        return dict(zip(percentiles, np.percentile(latencies, percentiles) * 1000))
+
+    def to_dict(self):
+        p50, p99 = self.get_percentiles().values()
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "p50_ms": p50,
+            "p99_ms": p99,
+        }
+
+    def __str__(self):
+        stats = self.to_dict()
+        if stats["requests"] == 0:
+            return "no requests yet"
+        return (
+            f"{stats['requests']} requests in {stats['batches']} batches: "
+            f"p50 {stats['p50_ms']:.3f}ms, p99 {stats['p99_ms']:.3f}ms"
+        )
+
+
+class MicroBatcher:
+    """
+    Combines prediction requests from any number of threads into batches, which are predicted by a single worker thread.
+
+    Whatever is queued while a batch is predicted becomes the next batch (up to max_batch_size rows), so single requests aren't delayed and load spikes are answered with fewer, bigger queries. With max_wait > 0, the worker additionally waits up to max_wait seconds for more requests before predicting a batch.
+
+    with MicroBatcher(load_region_classifier()) as batcher:
+        probabilities = batcher.predict_proba(X)  # blocks until the batch X ended up in was predicted
+    print(batcher.stats)  # p50/p99 latency
+    """
+
+    def __init__(self, classifier: RegionClassifier, max_batch_size=1024, max_wait=0.0):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = LatencyStats()
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, X: np.ndarray):
+        """
+        Queues the rows of X (features in the order of classifier.feature_names) for prediction, returning a Future of their class probabilities.
+
+        Invalid requests (wrong number of features, missing or infinite values) are rejected right away - only their own Future fails, they never end up in a batch with other requests.
+        """
+        future = Future()
+        try:
+            X = np.asarray(X, dtype=np.float64).reshape(
+                -1, len(self.classifier.feature_names)
+            )
+        except (TypeError, ValueError) as e:
+            future.set_exception(e)
+            return future
+        if not np.isfinite(X).all():
+            future.set_exception(ValueError("features contain NaN or infinite values"))
+            return future
+        self.queue.put((X, future, time.perf_counter()))
+        return future
+
+    def predict_proba(self, X: np.ndarray):
+        return self.submit(X).result()
+
+    def get_batch(self):
+        # blocks until there is a request, then takes what else is queued (or arrives within max_wait)
+        batch = [self.queue.get()]
+        if batch[0] is None:
+            return None
+        n_rows = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_batch_size:
+            try:
+                request = (
+                    self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                    if self.max_wait > 0
+                    else self.queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if request is None:
+                # finish this batch before stopping
+                self.queue.put(None)
+                break
+            batch.append(request)
+            n_rows += len(request[0])
+        return batch
+
+    def run(self):
+        while (batch := self.get_batch()) is not None:
+            try:
+                probabilities = self.classifier.predict_proba(
+                    np.concatenate([X for X, _, _ in batch])
+                )
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            offsets = np.cumsum([len(X) for X, _, _ in batch])[:-1]
+            for (_, future, _), result in zip(batch, np.split(probabilities, offsets)):
+                future.set_result(result)
+            finished_at = time.perf_counter()
+            self.stats.record_batch(
+                [finished_at - submitted_at for _, _, submitted_at in batch]
+            )
+
+    def close(self):
+        self.queue.put(None)
+        self.worker.join()
+
+
+def get_request_handler(batcher: MicroBatcher, track_feats: pd.DataFrame = None):
+    """
+    Returns a request handler for the HTTP API of serve_region_classifier.
+    """
+    classifier = batcher.classifier
+
+    class RegionClassifierRequestHandler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, content):
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.send_json(200, batcher.stats.to_dict())
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self.send_json(404, {"error": "not found"})
+                return
+            try:
+                request = json.loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                if "ids" in request:
+                    if track_feats is None:
+                        raise ValueError(
+                            "no track features loaded, send features instead"
+                        )
+                    ids = pd.Index(request["ids"])
+                    known_ids = ids[ids.isin(track_feats.index)]
+                    X = classifier.get_features(track_feats.loc[known_ids])
+                else:
+                    known_ids = None
+                    X = classifier.get_features(pd.DataFrame(request["tracks"]))
+            except (KeyError, TypeError, ValueError) as e:
+                self.send_json(400, {"error": f"invalid request: {e!r}"})
+                return
+            try:
+                probabilities = batcher.predict_proba(X)
+            except ValueError as e:
+                self.send_json(400, {"error": f"invalid request: {e!r}"})
+                return
+            except Exception as e:
+                self.send_json(500, {"error": f"prediction failed: {e!r}"})
+                return
+            predictions = [
+                {
+                    "region": classifier.classes[row.argmax()],
+                    "probabilities": dict(zip(classifier.classes, row.tolist())),
+                }
+                for row in probabilities
+            ]
+            if known_ids is not None:
+                predictions = dict(zip(known_ids, predictions))
+                # tracks without (complete) features get no prediction
+                predictions = [
+                    {"id": track_id, **predictions.get(track_id, {"region": None})}
+                    for track_id in request["ids"]
+                ]
+            self.send_json(200, {"predictions": predictions})
+
+        def log_message(self, format, *args):
+            # don't print a line per request
+            pass
+
+    return RegionClassifierRequestHandler
+
+
+def serve_region_classifier(
+    model_name="best_std_knn",
+    track_feats: pd.DataFrame = None,
+    host="127.0.0.1",
+    port=8000,
+    **batcher_kwargs,
+):
+    """
+    Serves predictions of the given model over HTTP (until interrupted):
+
+    POST /predict with {"tracks": [{<feature>: <value>, ...}, ...]} or {"ids": [<track ID>, ...]} (only if track_feats, indexed by track ID, are given) returns {"predictions": [{"region": ..., "probabilities": {<region>: ...}}, ...]}
+    GET /stats returns the number of requests and p50/p99 latency (in ms, including the time spent waiting for the batch)
+
+    Every HTTP request is handled in its own thread, concurrent requests are predicted together (see MicroBatcher, batcher_kwargs are passed on to it).
+    """
+    if track_feats is not None and "id" in track_feats.columns:
+        track_feats = track_feats.set_index("id")
+    with MicroBatcher(load_region_classifier(model_name), **batcher_kwargs) as batcher:
+        server = ThreadingHTTPServer(
+            (host, port), get_request_handler(batcher, track_feats)
+        )
+        print(f"serving {model_name} on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            print(batcher.stats)
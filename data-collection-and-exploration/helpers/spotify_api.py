@@ -0,0 +1,224 @@
+"""
+Concurrent, rate-limited fetching of Spotify objects (tracks, artists, albums, audio features) in batches via the Web API.
+
+Authentication uses the client credentials flow with the SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET environment variables (see README.md).
+"""
+
+import asyncio
+import os
+import time
+import aiohttp
+import pyarrow as pa
+from .async_http import TokenBucket, request_with_retries, run_coroutine
+
+API_URL = "https://api.spotify.com/v1"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+# max. number of IDs per request and key of the list of objects in the response for each endpoint
+BATCH_ENDPOINTS = {
+    "tracks": (50, "tracks"),
+    "artists": (50, "artists"),
+    "albums": (20, "albums"),
+    "audio-features": (100, "audio_features"),
+}
+
+AUDIO_FEATURES_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("danceability", pa.float64()),
+        ("energy", pa.float64()),
+        ("key", pa.int8()),
+        ("loudness", pa.float64()),
+        ("mode", pa.int8()),
+        ("speechiness", pa.float64()),
+        ("acousticness", pa.float64()),
+        ("instrumentalness", pa.float64()),
+        ("liveness", pa.float64()),
+        ("valence", pa.float64()),
+        ("tempo", pa.float64()),
+        ("type", pa.string()),
+        ("uri", pa.string()),
+        ("track_href", pa.string()),
+        ("analysis_url", pa.string()),
+        ("duration_ms", pa.int64()),
+        ("time_signature", pa.int8()),
+    ]
+)
+
+
+def audio_features_to_table(objects):
+    """
+    Converts audio feature objects returned by the API to a typed pyarrow Table (with AUDIO_FEATURES_SCHEMA). None entries (tracks without audio features) are dropped.
+    """
+    rows = [
+        {field: obj.get(field) for field in AUDIO_FEATURES_SCHEMA.names}
+        for obj in objects
+        if obj is not None
+    ]
+    return pa.Table.from_pylist(rows, schema=AUDIO_FEATURES_SCHEMA)
+
+
+def split_into_batches(ids, batch_size):
+    ids = list(ids)
+    return [ids[i : i + batch_size] for i in range(0, len(ids), batch_size)]
+
+
+class SpotifyBatchFetcher:
+    """
+    Fetches Spotify objects for lots of IDs, sending several batch requests concurrently.
+
+    max_concurrency limits the number of requests (and connections) in flight, requests_per_second the average request rate. 429 responses make all requests wait for as long as Spotify tells us to (Retry-After header), other transient errors are retried with exponential backoff.
+
+    api_url and token_url can be pointed to a local mock server for testing.
+
+    Use as async context manager:
+
+    async with SpotifyBatchFetcher() as fetcher:
+        tracks = await fetcher.fetch("tracks", track_ids)
+    """
+
+    def __init__(
+        self,
+        client_id: str = None,
+        client_secret: str = None,
+        max_concurrency: int = 8,
+        requests_per_second: float = 10,
+        max_retries: int = 5,
+        api_url: str = API_URL,
+        token_url: str = TOKEN_URL,
+    ):
+        self.client_id = client_id or os.getenv("SPOTIPY_CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("SPOTIPY_CLIENT_SECRET")
+        if not self.client_id or not self.client_secret:
+            raise RuntimeError(
+                "No Spotify API credentials found! Set SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET (e.g. in a .env file)"
+            )
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.api_url = api_url.rstrip("/")
+        self.token_url = token_url
+        self.session = None
+        self.access_token = None
+        self.token_expires_at = 0.0
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.rate_limiter = TokenBucket(self.requests_per_second)
+        self.token_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def get_access_token(self):
+        async with self.token_lock:
+            # refresh a bit before the token actually expires
+            if time.monotonic() > self.token_expires_at - 60:
+                resp = await request_with_retries(
+                    self.session,
+                    "POST",
+                    self.token_url,
+                    max_retries=self.max_retries,
+                    data={"grant_type": "client_credentials"},
+                    auth=aiohttp.BasicAuth(self.client_id, self.client_secret),
+                )
+                self.access_token = resp["access_token"]
+                self.token_expires_at = time.monotonic() + resp.get("expires_in", 3600)
+            return self.access_token
+
+    async def fetch_batch(self, endpoint: str, ids):
+        """
+        Fetches the objects for a single batch of IDs (at most the max. batch size of the endpoint).
+        """
+        result_key = BATCH_ENDPOINTS[endpoint][1]
+        async with self.semaphore:
+            token = await self.get_access_token()
+            resp = await request_with_retries(
+                self.session,
+                "GET",
+                f"{self.api_url}/{endpoint}",
+                rate_limiter=self.rate_limiter,
+                max_retries=self.max_retries,
+                params={"ids": ",".join(ids)},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+        return resp[result_key]
+
+    async def fetch_batches(self, endpoint: str, batches, on_batch=None):
+        """
+        Fetches the objects for each batch of IDs in batches concurrently and returns a list with the results for each batch (in the same order).
+
+        If given, on_batch(batch_index, objects) is called as soon as the results for a batch arrive (e.g. for checkpointing).
+        """
+
+        async def fetch_and_report(i, batch):
+            objects = await self.fetch_batch(endpoint, batch)
+            if on_batch is not None:
+                on_batch(i, objects)
+            return objects
+
+        return await asyncio.gather(
+            *[fetch_and_report(i, batch) for i, batch in enumerate(batches)]
+        )
+
+    async def fetch(self, endpoint: str, ids, on_batch=None):
+        """
+        Fetches the objects for all the given IDs, using the max. batch size of the endpoint. Returns them as a list, in the order of ids (None for IDs Spotify doesn't know).
+        """
+        batches = split_into_batches(ids, BATCH_ENDPOINTS[endpoint][0])
+        results = await self.fetch_batches(endpoint, batches, on_batch)
+        return [obj for batch_objects in results for obj in batch_objects]
+
+
+def fetch_spotify_objects(endpoint: str, ids, on_batch=None, **fetcher_kwargs):
+    """
+    Synchronous wrapper around SpotifyBatchFetcher.fetch (for use in scripts and notebooks).
+
+    fetcher_kwargs are passed on to SpotifyBatchFetcher.
+    """
+
+    async def fetch():
+        async with SpotifyBatchFetcher(**fetcher_kwargs) as fetcher:
+            return await fetcher.fetch(endpoint, ids, on_batch)
+
+    return run_coroutine(fetch())
+
+
+def fetch_spotify_batches(endpoint: str, batches, on_batch=None, **fetcher_kwargs):
+    """
+    Synchronous wrapper around SpotifyBatchFetcher.fetch_batches (for use in scripts and notebooks).
+
+    fetcher_kwargs are passed on to SpotifyBatchFetcher.
+    """
+
+    async def fetch():
+        async with SpotifyBatchFetcher(**fetcher_kwargs) as fetcher:
+            return await fetcher.fetch_batches(endpoint, batches, on_batch)
+
+    return run_coroutine(fetch())
+
+
+def fetch_into_store(store, endpoint: str, ids, **fetcher_kwargs):
+    """
+    Fetches the objects for all ids that are not in store (a helpers.checkpoint.CheckpointStore) yet and adds each batch of results to the store as soon as it arrives (so crawls can be interrupted and resumed anytime).
+
+    fetcher_kwargs are passed on to SpotifyBatchFetcher.
+    """
+    ids = list(ids)
+    positions = {id: pos for pos, id in enumerate(ids)}
+    missing_ids = store.missing(dict.fromkeys(ids))
+    print(f"{len(positions) - len(missing_ids)} of {len(positions)} IDs already done")
+    if not missing_ids:
+        return
+    batches = split_into_batches(missing_ids, BATCH_ENDPOINTS[endpoint][0])
+
+    def store_batch(i, objects):
+        batch = batches[i]
+        store.add(batch, objects, positions=[positions[id] for id in batch])
+
+    fetch_spotify_batches(endpoint, batches, on_batch=store_batch, **fetcher_kwargs)
@@ -0,0 +1,216 @@
+"""
+Prefix sums of the streams of every (track, region) pair over the days it charted, for range totals and top lists over arbitrary date windows without scanning the charts.
+
+The sums are stored sparsely, one entry per chart entry, sorted by (track, region) pair - the rows of the chart cube (see helpers.cube) - and date. Entries are identified by key = row * number of days + day (day = position in the dates of the cube), and cum_streams[i] is the sum of the streams of all entries before entry i (cum_streams[0] = 0). The entries of a pair between two days are found with two binary searches over the keys, so its total streams are cum_streams[hi] - cum_streams[lo] and its days on the chart hi - lo.
+
+The sums are derived from the chart cube and stored next to it (in CHART_CUBE_DIR), so they are re-built along with the cube whenever top50.csv changed.
+"""
+
+import os
+from functools import cache
+import numpy as np
+import pandas as pd
+from . import get_data_path, get_source_key
+from .cube import CHART_CUBE_DIR, ChartCube, load_chart_cube
+
+# number of cube rows read at a time while building the sums
+BUILD_BLOCK_SIZE = 20000
+
+
+def get_stream_sums_path(cube_dir=CHART_CUBE_DIR):
+    return os.path.join(cube_dir, "stream_sums.npz")
+
+
+class StreamSums:
+    """
+    Date-range totals of streams and days on the chart per (track, region) pair, track and region (see the module docstring).
+
+    sums = get_stream_sums()
+    sums.get_total(track_id, "Germany", "2021-01-01", "2021-03-31")  # (streams, days on chart)
+    sums.get_top_tracks(50, "2021-06-01", "2021-08-31", regions=["Global"])
+    """
+
+    def __init__(self, cube: ChartCube, keys: np.ndarray, cum_streams: np.ndarray):
+        self.cube = cube
+        self.keys = keys
+        self.cum_streams = cum_streams
+        self.n_days = len(cube.dates)
+
+    @classmethod
+    def from_cube(cls, cube: ChartCube, block_size=BUILD_BLOCK_SIZE):
+        """
+        Builds the prefix sums from the non-empty cells of the cube, block_size rows at a time.
+        """
+        ranks, streams = cube.values["rank"], cube.values["streams"]
+        n_days = ranks.shape[1]
+        keys, entry_streams = [], []
+        for block_start in range(0, ranks.shape[0], block_size):
+            block = slice(block_start, block_start + block_size)
+            # np.nonzero returns the cells in row-major order, i.e. sorted by row and day
+            rows, days = np.nonzero(ranks[block])
+            keys.append((rows.astype(np.int64) + block_start) * n_days + days)
+            entry_streams.append(streams[block][rows, days])
+        keys = np.concatenate(keys) if keys else np.zeros(0, np.int64)
+        cum_streams = np.zeros(len(keys) + 1, dtype=np.int64)
+        if entry_streams:
+            np.cumsum(
+                np.concatenate(entry_streams), dtype=np.int64, out=cum_streams[1:]
+            )
+        return cls(cube, keys, cum_streams)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, keys=self.keys, cum_streams=self.cum_streams)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, cube: ChartCube, path):
+        with np.load(path) as data:
+            return cls(cube, data["keys"], data["cum_streams"])
+
+    def get_day_range(self, start=None, end=None):
+        # first day and the day after the last day (positions in the dates of the cube)
+        first, stop, _ = self.cube.get_date_slice(start, end).indices(self.n_days)
+        return first, max(first, stop)
+
+    def get_entry_bounds(self, rows, start=None, end=None):
+        """
+        Returns the positions of the first and after the last entry between start and end (inclusive, both optional) for each of the given cube rows.
+        """
+        first, stop = self.get_day_range(start, end)
+        rows = np.asarray(rows, dtype=np.int64) * self.n_days
+        return (
+            np.searchsorted(self.keys, rows + first),
+            np.searchsorted(self.keys, rows + stop),
+        )
+
+    def get_row_totals(self, start=None, end=None, regions=None):
+        """
+        Returns the total streams and days on the chart of every cube row between start and end as two arrays. Rows of regions that aren't in regions (if given) have a total of 0.
+        """
+        lo, hi = self.get_entry_bounds(
+            np.arange(len(self.cube.row_region_codes)), start, end
+        )
+        streams, days = self.cum_streams[hi] - self.cum_streams[lo], hi - lo
+        if regions is not None:
+            excluded = ~self.get_region_mask(regions)[self.cube.row_region_codes]
+            streams[excluded], days[excluded] = 0, 0
+        return streams, days
+
+    def get_region_mask(self, regions):
+        selected_regions = np.zeros(len(self.cube.regions), dtype=bool)
+        positions = self.cube.regions.get_indexer(regions)
+        selected_regions[positions[positions != -1]] = True
+        return selected_regions
+
+    def get_total(self, track_id: str, region=None, start=None, end=None):
+        """
+        Returns the total streams and days on the chart of a track in a region (or all regions) between start and end (inclusive, both optional).
+
+        Without region, days on the chart are summed over all regions (i.e. they are the number of chart entries).
+        """
+        if track_id not in self.cube.tracks:
+            return 0, 0
+        rows = self.cube.get_rows(track_id)
+        rows = np.arange(rows.start, rows.stop)
+        if region is not None:
+            rows = rows[self.cube.regions[self.cube.row_region_codes[rows]] == region]
+        lo, hi = self.get_entry_bounds(rows, start, end)
+        return (
+            int((self.cum_streams[hi] - self.cum_streams[lo]).sum()),
+            int((hi - lo).sum()),
+        )
+
+    def get_pair_totals(self, start=None, end=None, regions=None):
+        """
+        Returns a DataFrame with the total streams and days_on_chart of every (track, region) pair that charted between start and end (in id and region column), optionally only in the given regions.
+        """
+        streams, days = self.get_row_totals(start, end, regions)
+        rows = np.flatnonzero(days)
+        track_positions = (
+            np.searchsorted(self.cube.track_offsets, rows, side="right") - 1
+        )
+        return pd.DataFrame(
+            {
+                "id": self.cube.tracks[track_positions],
+                "region": self.cube.regions[self.cube.row_region_codes[rows]],
+                "streams": streams[rows],
+                "days_on_chart": days[rows],
+            }
+        )
+
+    def get_track_totals(self, start=None, end=None, regions=None):
+        """
+        Returns a DataFrame (indexed by track ID) with the total streams and days_on_chart (summed over all regions, i.e. number of chart entries) of every track that charted between start and end, optionally only in the given regions.
+        """
+        streams, days = self.get_row_totals(start, end, regions)
+        # rows are sorted by track, so the totals of each track are the sum of a contiguous block
+        offsets = self.cube.track_offsets[:-1]
+        totals = pd.DataFrame(
+            {
+                "streams": np.add.reduceat(streams, offsets) if len(offsets) else [],
+                "days_on_chart": np.add.reduceat(days, offsets) if len(offsets) else [],
+            },
+            index=self.cube.tracks,
+        )
+        return totals[totals.days_on_chart > 0]
+
+    def get_top_tracks(self, k=50, start=None, end=None, regions=None):
+        """
+        Returns the k tracks with the most streams between start and end (optionally only counting the given regions), as DataFrame like get_track_totals sorted by streams.
+        """
+        totals = self.get_track_totals(start, end, regions)
+        if len(totals) > k:
+            top = np.argpartition(-totals.streams.to_numpy(), k - 1)[:k]
+            totals = totals.iloc[top]
+        return totals.sort_values("streams", ascending=False)
+
+    def get_prefix_sum_table(self, track_ids=None):
+        """
+        Returns the prefix sums as DataFrame with one row per chart entry (optionally only of the given tracks): id, region, date, cum_streams and cum_days (streams and days on the chart of the pair up to and including that date).
+
+        The total of a pair between two dates is the difference of the cumulative values at the last entry up to the end date and the last entry before the start date (this is the table exported to the website database).
+        """
+        entries = np.arange(len(self.keys))
+        rows, days = np.divmod(self.keys, self.n_days)
+        if track_ids is not None:
+            positions = self.cube.tracks.get_indexer(track_ids)
+            selected_tracks = np.zeros(len(self.cube.tracks), dtype=bool)
+            selected_tracks[positions[positions != -1]] = True
+            selected_rows = np.repeat(selected_tracks, np.diff(self.cube.track_offsets))
+            entries = entries[selected_rows[rows]]
+            rows, days = rows[entries], days[entries]
+        # first entry of the pair of each entry (entries of a pair are contiguous)
+        pair_starts = np.searchsorted(self.keys, rows * self.n_days)
+        track_positions = (
+            np.searchsorted(self.cube.track_offsets, rows, side="right") - 1
+        )
+        return pd.DataFrame(
+            {
+                "id": self.cube.tracks[track_positions],
+                "region": self.cube.regions[self.cube.row_region_codes[rows]],
+                "date": self.cube.dates[days],
+                "cum_streams": self.cum_streams[entries + 1]
+                - self.cum_streams[pair_starts],
+                "cum_days": entries - pair_starts + 1,
+            }
+        )
+
+
+@cache
+def load_stream_sums(source_key: str):
+    cube = load_chart_cube(source_key)
+    path = get_stream_sums_path()
+    if os.path.exists(path):
+        return StreamSums.load(cube, path)
+    print(f"building stream prefix sums in '{path}'")
+    sums = StreamSums.from_cube(cube)
+    sums.save(path)
+    return sums
+
+
+def get_stream_sums():
+    """
+    Returns the stream prefix sums (StreamSums) of the current version of top50.csv, building them (and the chart cube) first if necessary.
+    """
+    return load_stream_sums(get_source_key(get_data_path("top50.csv")))
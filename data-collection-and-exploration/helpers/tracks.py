@@ -0,0 +1,61 @@
+"""
+Vectorized transformations of the track data fetched from the Spotify API.
+"""
+
+import pandas as pd
+
+
+def get_track_artist_ranks(tracks: pd.DataFrame, fields=("id",)):
+    """
+    Turns the artists column of tracks (lists of Spotify artist objects) into a table with one row per (track, artist), in a single vectorized pass.
+
+    The result has a track_id column, an artist_<field> column for each of the given fields of the artist objects and a rank column (1 for the primary artist of a track, 2 for the next one etc.).
+    """
+    exploded = tracks[["id", "artists"]].explode("artists", ignore_index=True)
+    exploded = exploded.loc[exploded.artists.notna()]
+    ranks = pd.DataFrame({"track_id": exploded.id})
+    for field in fields:
+        ranks[f"artist_{field}"] = exploded.artists.str.get(field)
+    ranks["rank"] = exploded.groupby("id", sort=False).cumcount() + 1
+    return ranks.reset_index(drop=True)
+
+
+def extract_track_artists_and_genres(
+    tracks: pd.DataFrame, artist_data: pd.DataFrame, max_artists=3
+):
+    """
+    For each track in tracks (with id and artists columns, artists being lists of Spotify artist objects), returns the IDs and names of the first max_artists artists (artist_id_<rank> and artist_name_<rank> columns) and a list of genres.
+
+    Spotify tracks don't have genre labels, so the genres of the featured artists are used instead (artist_data, indexed by artist ID, with genres column): genres of the primary artist come first, followed by those of the second, third ... artist (without duplicates).
+
+    The result is indexed by track_id, with columns sorted alphabetically.
+    """
+    track_artists = get_track_artist_ranks(tracks, fields=("id", "name"))
+    track_artists = track_artists.loc[track_artists["rank"] <= max_artists]
+
+    artist_columns = track_artists.pivot(
+        index="track_id", columns="rank", values=["artist_id", "artist_name"]
+    )
+    artist_columns.columns = [f"{col}_{rank}" for col, rank in artist_columns.columns]
+
+    # order of the rows is preserved by explode and merge (with how="left"), so drop_duplicates keeps the first occurrence of each genre
+    track_genres = (
+        track_artists[["track_id", "artist_id"]]
+        .merge(
+            artist_data.genres.rename_axis("artist_id").reset_index(),
+            on="artist_id",
+            how="left",
+        )
+        .explode("genres")
+        .dropna(subset="genres")
+        .drop_duplicates(subset=["track_id", "genres"])
+        .groupby("track_id", sort=False)
+        .genres.agg(list)
+    )
+
+    result = artist_columns.reindex(pd.Index(tracks.id, name="track_id"))
+    result["genres"] = track_genres.reindex(result.index)
+    result["genres"] = [
+        genres if isinstance(genres, list) else [] for genres in result.genres
+    ]
+    return result.sort_index(axis=1)
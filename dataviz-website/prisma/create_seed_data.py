@@ -1,18 +1,38 @@
 # this script is used to create the JSON files that are rquired for creating the data for the SQLite database
 # if you already have the db.sqlite file from Google Drive, you don't need to run this script
+# every table is built by a stage function below - stages pass their results on in memory and are cached on disk with helpers.disk_cache,
+# so re-running the script only rebuilds the stages whose inputs (data files or code) changed (and doesn't hit any APIs if nothing changed)
 # %%
-from ast import literal_eval
-from helpers import get_data_path, split_dataframe
+from helpers import get_data_path, read_csv_cached, get_charts, disk_cache
+from helpers.checkpoint import CheckpointStore
+from helpers.spotify_api import fetch_into_store
+from helpers.stream_sums import get_stream_sums
+from bulk_load import load_seed_data
+from dotenv import load_dotenv
 import pandas as pd
 import os
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from multiprocessing import Pool
-import tqdm
 import json
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
+ISO_COUNTRIES_URL = "https://raw.githubusercontent.com/lukes/ISO-3166-Countries-with-Regional-Codes/master/all/all.csv"
+
+# data files the track-related stages are built from
+TRACK_SOURCES = ("artist_data.csv", "track_artists.csv", "top50_track_data.csv")
+
+renames_country_info = {
+    "United States of America": "United States",
+    "United Kingdom of Great Britain and Northern Ireland": "United Kingdom",
+    "Czechia": "Czech Republic",
+    "Taiwan, Province of China": "Taiwan",
+    "Korea, Republic of": "South Korea",
+}
+
+renames_isrc_territory = {
+    "Chinese Taipei": "Taiwan",
+    "Hong Kong SAR, China": "Hong Kong",
+}
+
 
 def to_camel_case(snake_str):
     components = snake_str.split("_")
@@ -32,6 +52,7 @@ def store_and_print_info(df: pd.DataFrame, filename: str):
     print(df.dtypes)
     print("Shape:", df.shape)
     print()
+    return df
 
 
 def extract_image_urls(images):
@@ -45,84 +66,226 @@ def extract_image_urls(images):
     return cover_thumbnail_url, cover_img_url
 
 
-# %%
-artists = pd.read_csv(
-    get_data_path("artist_data.csv"),
-    converters={"genres": literal_eval, "images": literal_eval},
-)
-noname_artist_ids = artists.loc[artists.name.isna(), "id"]
-artists_filtered = artists[artists.name.notna()]
+def get_artist_data():
+    return read_csv_cached("artist_data.csv", nested_columns=("genres", "images"))
 
-track_artists = pd.read_csv(get_data_path("track_artists.csv"))
 
-tracks = pd.read_csv(get_data_path("top50_track_data.csv"))
-tracks_filtered = tracks.drop(
-    columns=[col for col in tracks.columns if col.startswith("artist_")] + ["genres"]
-)
-tracks_filtered = tracks_filtered[
-    tracks_filtered["name"].notna()
-    & tracks_filtered["loudness"].notna()
-    & tracks_filtered["isrc"].notna()
-]
-tracks_featuring_noname_artists = track_artists[
-    track_artists.artist_id.isin(noname_artist_ids)
-].track_id.unique()
-tracks_filtered = tracks_filtered[
-    ~tracks_filtered.id.isin(tracks_featuring_noname_artists)
-]
-tracks_filtered = tracks_filtered.loc[
-    :,
-    ~tracks_filtered.columns.str.startswith("album")
-    | tracks_filtered.columns.str.contains("album_id"),
-]  # remove album columns that are not albumId -> stored in albums table
-store_and_print_info(tracks_filtered, "tracks")
-
-# filter out non-existing tracks and artists as we would otherwise get foreign key constraint errors when adding track artists information to the database
-track_artists = track_artists[
-    (track_artists.artist_id.isin(artists_filtered.id))
-    & (track_artists.track_id.isin(tracks_filtered.id))
-]
-store_and_print_info(track_artists, "track_artists")
-
-top50 = (
-    pd.read_csv(get_data_path("top50.csv"))
-    .sort_values(["date", "region"])
-    .rename(columns={"id": "trackId", "region": "countryName"})
-)
-top50_filtered = top50[top50.trackId.isin(tracks_filtered.id)]
-top50_global = top50_filtered[top50_filtered.countryName == "Global"].drop(
-    columns=["countryName"]
+def rename_least_frequent_to_other(series, share_of_total=0.01):
+    """Rename least frequent values to 'Other'."""
+    counts = series.value_counts()
+    least_frequent = counts[counts < share_of_total * counts.sum()]
+    return series.replace(least_frequent.index, "Other")
+
+
+def map_categorical_track_features(tracks: pd.DataFrame):
+    """
+    Maps categorical track features encoded with boolean/numbers to human-readable strings.
+    """
+    tracks["mode"] = tracks["mode"].astype("category")
+    tracks["mode"] = tracks["mode"].cat.rename_categories({0: "Minor", 1: "Major"})
+    tracks["time_signature"] = rename_least_frequent_to_other(tracks.time_signature)
+    tracks["time_signature"] = tracks["time_signature"].astype("category")
+    tracks["time_signature"] = tracks["time_signature"].cat.rename_categories(
+        {3: "3/4", 4: "4/4", 5: "5/4"}
+    )
+    tracks["explicit"] = tracks["explicit"].astype("category")
+    tracks["explicit"] = tracks["explicit"].cat.rename_categories({0: "No", 1: "Yes"})
+    tracks["key"] = tracks["key"].astype("category")
+    tracks["key"] = tracks["key"].cat.rename_categories(
+        {
+            0: "C",
+            1: "C#/Db",
+            2: "D",
+            3: "D#/Eb",
+            4: "E",
+            5: "F",
+            6: "F#/Gb",
+            7: "G",
+            8: "G#/Ab",
+            9: "A",
+            10: "A#/Bb",
+            11: "B",
+        }
+    )
+    return tracks
+
+
+# disk_cache only fingerprints the source of the stage itself, so the helpers a stage calls are listed in depends_on
+@disk_cache(
+    sources=TRACK_SOURCES,
+    depends_on=(
+        get_artist_data,
+        map_categorical_track_features,
+        rename_least_frequent_to_other,
+    ),
 )
-store_and_print_info(top50_global, "top50_global")
-top50_countries = top50_filtered[top50_filtered.countryName != "Global"]
-store_and_print_info(top50_countries, "top50_countries")
+def get_seed_tracks():
+    artists = get_artist_data()
+    noname_artist_ids = artists.loc[artists.name.isna(), "id"]
+    track_artists = pd.read_csv(get_data_path("track_artists.csv"))
+
+    tracks = pd.read_csv(get_data_path("top50_track_data.csv"))
+    tracks_filtered = tracks.drop(
+        columns=[col for col in tracks.columns if col.startswith("artist_")]
+        + ["genres"]
+    )
+    tracks_filtered = tracks_filtered[
+        tracks_filtered["name"].notna()
+        & tracks_filtered["loudness"].notna()
+        & tracks_filtered["isrc"].notna()
+    ]
+    tracks_featuring_noname_artists = track_artists[
+        track_artists.artist_id.isin(noname_artist_ids)
+    ].track_id.unique()
+    tracks_filtered = tracks_filtered[
+        ~tracks_filtered.id.isin(tracks_featuring_noname_artists)
+    ]
+    tracks_filtered = tracks_filtered.loc[
+        :,
+        ~tracks_filtered.columns.str.startswith("album")
+        | tracks_filtered.columns.str.contains("album_id"),
+    ]  # remove album columns that are not albumId -> stored in albums table
+    return map_categorical_track_features(tracks_filtered.reset_index(drop=True))
+
+
+@disk_cache(sources=TRACK_SOURCES, depends_on=(get_seed_tracks, get_artist_data))
+def get_seed_track_artists():
+    artists = get_artist_data()
+    artists_filtered = artists[artists.name.notna()]
+    tracks = get_seed_tracks()
+    track_artists = pd.read_csv(get_data_path("track_artists.csv"))
+    # filter out non-existing tracks and artists as we would otherwise get foreign key constraint errors when adding track artists information to the database
+    return track_artists[
+        (track_artists.artist_id.isin(artists_filtered.id))
+        & (track_artists.track_id.isin(tracks.id))
+    ].reset_index(drop=True)
+
+
+@disk_cache(sources=("top50.csv", *TRACK_SOURCES), depends_on=(get_seed_tracks,))
+def get_seed_chart_entries():
+    tracks = get_seed_tracks()
+    top50 = (
+        get_charts()
+        .sort_values(["date", "region"])
+        .rename(columns={"id": "trackId", "region": "countryName"})
+    )
+    top50["countryName"] = top50.countryName.astype(str)
+    # dates are stored as strings in the JSON files (not as timestamps)
+    top50["date"] = top50.date.dt.strftime("%Y-%m-%d")
+    return top50[top50.trackId.isin(tracks.id)].reset_index(drop=True)
+
+
+def get_seed_global_chart_entries():
+    top50 = get_seed_chart_entries()
+    return top50[top50.countryName == "Global"].drop(columns=["countryName"])
+
+
+def get_seed_country_chart_entries():
+    top50 = get_seed_chart_entries()
+    return top50[top50.countryName != "Global"]
+
+
+# cumulative streams and days on the chart per track and region (see helpers.stream_sums), for date range totals without summing up the chart entries
+@disk_cache(sources=("top50.csv", *TRACK_SOURCES), depends_on=(get_seed_tracks,))
+def get_seed_stream_sums():
+    tracks = get_seed_tracks()
+    stream_sums = (
+        get_stream_sums()
+        .get_prefix_sum_table(tracks.id)
+        .rename(
+            columns={
+                "id": "trackId",
+                "cum_streams": "cumStreams",
+                "cum_days": "cumDays",
+            }
+        )
+    )
+    stream_sums["region"] = stream_sums.region.astype(str)
+    stream_sums["date"] = stream_sums.date.dt.strftime("%Y-%m-%d")
+    return stream_sums
 
-countries = pd.read_csv(get_data_path("spotify_region_metadata.csv")).rename(
-    columns={"spotify_region": "name"}
+
+@disk_cache(
+    sources=("spotify_region_metadata.csv", *TRACK_SOURCES),
+    depends_on=(get_seed_tracks,),
 )
-store_and_print_info(countries, "countries")
+def get_seed_countries():
+    countries = pd.read_csv(get_data_path("spotify_region_metadata.csv")).rename(
+        columns={
+            "spotify_region": "name",
+            "iso_alpha3": "isoAlpha3",
+            "iso_alpha2": "isoAlpha2",
+            "geo_region": "geoRegion",
+            "geo_subregion": "geoSubregion",
+        }
+    )
 
-# %%
-# get album data
-def get_artist_ids(artists_list):
-    return [artist["id"] for artist in artists_list]
+    # add regions mentioned in ISRC territory column of tracks
+    # (the ISO country list is downloaded once and kept in the data folder)
+    full_country_info = pd.read_csv(
+        get_data_path("iso_3166_countries.csv", download_url=ISO_COUNTRIES_URL)
+    )
+    full_country_info_fixed = full_country_info.replace({"name": renames_country_info})
+    territories = (
+        get_seed_tracks()
+        .isrc_territory.drop_duplicates()
+        .replace(renames_isrc_territory)
+        .rename("isrcTerritory")
+    )
+    country_info_for_territories_fixed = pd.merge(
+        full_country_info_fixed,
+        territories,
+        left_on="name",
+        right_on="isrcTerritory",
+        how="right",
+    )
+    country_info_for_territories_fixed = pd.concat(
+        [
+            country_info_for_territories_fixed,
+            pd.DataFrame(
+                [
+                    {
+                        "name": "Kosovo",
+                        "alpha-2": "XK",
+                        "alpha-3": "XKX",
+                        "region": "Europe",
+                        "sub-region": "Eastern Europe",
+                    }
+                ]
+            ),
+        ]
+    )
+    country_info_for_territories_fixed.rename(
+        columns={
+            "alpha-2": "isoAlpha2",
+            "alpha-3": "isoAlpha3",
+            "region": "geoRegion",
+            "sub-region": "geoSubregion",
+        },
+        inplace=True,
+    )
+    countries_complete = pd.concat(
+        [countries, country_info_for_territories_fixed[countries.columns]]
+    ).drop_duplicates()
+    return countries_complete[~countries_complete.name.isna()].reset_index(drop=True)
+
+
+@disk_cache(sources=TRACK_SOURCES, depends_on=(get_seed_tracks,))
+def get_seed_isrc_agencies():
+    isrc_agency_data = get_seed_tracks()[
+        ["isrc_agency", "isrc_territory"]
+    ].drop_duplicates()
+    isrc_agency_data["isrc_territory"] = isrc_agency_data.isrc_territory.replace(
+        renames_isrc_territory
+    )
+    return isrc_agency_data.reset_index(drop=True)
 
 
-# fetch album data from Spotify API
-# NOTE: this step requires a Spotify API client ID and client secret (see https://developer.spotify.com/documentation/general/guides/app-settings/)
-# place them in a .env file in the root directory of this project (or wherever you run this script from)
-# the .env file should look like this:
-# SPOTIPY_CLIENT_ID=<your client ID>
-# SPOTIPY_CLIENT_SECRET=<your client secret>
-# SPOTIPY_REDIRECT_URI='http://127.0.0.1:9090'
-print("fetching album data from Spotify API...")
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth())
-track_album_ids = tracks_filtered.album_id.drop_duplicates().reset_index(drop=True)
-album_id_chunks = split_dataframe(pd.DataFrame(track_album_ids), chunk_size=20)
+def get_artist_ids(artists_list):
+    return [artist["id"] for artist in artists_list]
 
 
-def fetch_album_info(album_ids):
-    api_resp = sp.albums(album_ids)["albums"]
+def extract_album_info(album):
     keys_to_extract = [
         "id",
         "name",
@@ -133,216 +296,130 @@ def fetch_album_info(album_ids):
         "images",
         "album_type",
     ]
-    api_resp = [{key: album[key] for key in keys_to_extract} for album in api_resp]
-    chunk_data = pd.DataFrame(api_resp)
-    return chunk_data
-
-
-pool = Pool(processes=4)  # might have to lower that number depending on your machine
-results = list(
-    tqdm.tqdm(
-        pool.imap_unordered(
-            fetch_album_info,
-            [chunk.album_id.to_list() for chunk in album_id_chunks],
-        ),
-        total=len(album_id_chunks),
-    )
-)
-# try the code below if you run into issues with the code above - didn't work for me when experimenting with it (probably I was blocked bc of too many API requests)
-# pool = Pool(processes=20)
-# tasks = [pool.apply_async(fetch_album_info, args=(chunk.album_id.to_list(),)) for chunk in chunks]
-# pool.close()
-# pool.join()
-# results = [task.get() for task in tasks]
-album_data = pd.concat(results).reset_index(drop=True)
-album_data.rename(columns={"album_type": "type"}, inplace=True)
-album_data["artist_ids"] = album_data.artists.apply(get_artist_ids)
-album_data[["thumbnail_url", "img_url"]] = album_data.images.apply(
-    extract_image_urls
-).apply(pd.Series)
-album_data.drop(columns=["artists", "images"], inplace=True)
-
-album_artist_mapping = pd.DataFrame(
-    album_data.set_index("id").artistIds.explode()
-).rename(columns={"artist_ids": "artist_id"})
-album_artist_mapping["rank"] = album_artist_mapping.groupby("id").cumcount() + 1
-album_artist_mapping = album_artist_mapping.reset_index().rename(
-    columns={"id": "album_id"}
-)
-store_and_print_info(album_artist_mapping, "album_artists")
-
-album_data.drop(columns=["artist_ids"], inplace=True)
-store_and_print_info(album_data, "albums")
+    return {key: album[key] for key in keys_to_extract}
 
 
-# %%
-album_artist_ids = album_artist_mapping.artist_id.drop_duplicates().reset_index(
-    drop=True
-)
-# we don't have the artist data for all albums, so we need to fetch the missing data from the Spotify API as well
-missing_album_artist_ids = album_artist_ids[~album_artist_ids.isin(artists.id)].rename(
-    "artist_id"
+@disk_cache(
+    sources=TRACK_SOURCES,
+    depends_on=(
+        get_seed_tracks,
+        extract_album_info,
+        get_artist_ids,
+        extract_image_urls,
+    ),
 )
-album_artist_chunks = split_dataframe(
-    pd.DataFrame(missing_album_artist_ids), chunk_size=50
+def get_album_data():
+    # fetch album data from Spotify API
+    # NOTE: this step requires a Spotify API client ID and client secret (see https://developer.spotify.com/documentation/general/guides/app-settings/)
+    # place them in a .env file in the root directory of this project (or wherever you run this script from)
+    # the .env file should look like this:
+    # SPOTIPY_CLIENT_ID=<your client ID>
+    # SPOTIPY_CLIENT_SECRET=<your client secret>
+    # albums are checkpointed in data/checkpoints, so only albums that weren't fetched before are requested
+    print("fetching album data from Spotify API...")
+    load_dotenv()
+    track_album_ids = get_seed_tracks().album_id.drop_duplicates().tolist()
+    store = CheckpointStore("albums")
+    # batches of 20 albums are fetched concurrently (max_concurrency and requests_per_second can be tuned if Spotify keeps rate-limiting us)
+    fetch_into_store(store, "albums", track_album_ids, max_concurrency=8)
+    albums = [album for album in store.values(track_album_ids) if album is not None]
+    store.close()
+
+    album_data = pd.DataFrame([extract_album_info(album) for album in albums])
+    album_data.rename(columns={"album_type": "type"}, inplace=True)
+    album_data["artist_ids"] = album_data.artists.apply(get_artist_ids)
+    album_data[["thumbnail_url", "img_url"]] = album_data.images.apply(
+        extract_image_urls
+    ).apply(pd.Series)
+    return album_data.drop(columns=["artists", "images"])
+
+
+def get_seed_album_artists():
+    album_artist_mapping = pd.DataFrame(
+        get_album_data().set_index("id").artist_ids.explode()
+    ).rename(columns={"artist_ids": "artist_id"})
+    album_artist_mapping["rank"] = album_artist_mapping.groupby("id").cumcount() + 1
+    return album_artist_mapping.reset_index().rename(columns={"id": "album_id"})
+
+
+def get_seed_albums():
+    return get_album_data().drop(columns=["artist_ids"])
+
+
+@disk_cache(
+    sources=TRACK_SOURCES,
+    depends_on=(get_album_data, get_artist_data, extract_image_urls),
 )
-
-# %%
-print("fetching missing album artist data from Spotify API...")
-
-
-def fetch_artist_data(chunk):
-    api_resp = sp.artists(chunk.artist_id)["artists"]
-    chunk_data = pd.DataFrame(api_resp)
-    return chunk_data
+def get_seed_artists():
+    artists = get_artist_data()
+    artists_filtered = artists[artists.name.notna()]
+
+    album_artist_ids = get_seed_album_artists().artist_id.drop_duplicates()
+    # we don't have the artist data for all albums, so we need to fetch the missing data from the Spotify API as well
+    missing_album_artist_ids = album_artist_ids[
+        ~album_artist_ids.isin(artists.id)
+    ].tolist()
+    print("fetching missing album artist data from Spotify API...")
+    load_dotenv()
+    # same checkpoint store as the artist crawler (fetch_artist_data.py)
+    store = CheckpointStore("artists")
+    fetch_into_store(store, "artists", missing_album_artist_ids)
+    album_artist_data = store.to_frame(keys=missing_album_artist_ids)
+    store.close()
+
+    artist_final_data = pd.concat([artists_filtered, album_artist_data]).reset_index(
+        drop=True
+    )
+    artist_final_data[["thumbnail_url", "img_url"]] = artist_final_data.images.apply(
+        extract_image_urls
+    ).apply(pd.Series)
+    artist_final_data.drop(
+        columns=[
+            "images",
+            "external_urls",
+            "followers",
+            "href",
+            "popularity",
+            "type",
+            "uri",
+        ],
+        inplace=True,
+        errors="ignore",
+    )
+    artist_final_data["genres"] = artist_final_data.genres.apply(
+        json.dumps
+    )  # important, otherwise this is NOT a valid JSON array in the output and parsing will fail (took me a few hours to figure that out lol)
+    return artist_final_data
 
 
-album_artist_data = pd.concat(
-    [fetch_artist_data(chunk) for chunk in album_artist_chunks]
-).reset_index(drop=True)
-artist_final_data = pd.concat([artists_filtered, album_artist_data]).reset_index(
-    drop=True
-)
-artist_final_data[["thumbnail_url", "img_url"]] = artist_final_data.images.apply(
-    extract_image_urls
-).apply(pd.Series)
-artist_final_data.drop(
-    columns=[
-        "images",
-        "external_urls",
-        "followers",
-        "href",
-        "popularity",
-        "type",
-        "uri",
-    ],
-    inplace=True,
-)
 # %%
-artist_final_data["genres"] = artist_final_data.genres.apply(
-    json.dumps
-)  # important, otherwise this is NOT a valid JSON array in the output and parsing will fail (took me a few hours to figure that out lol)
-store_and_print_info(artist_final_data, "artists")
-
-# %%
-# add regions mentioned in ISRC territory column of tracks
-full_country_info = pd.read_csv(
-    "https://raw.githubusercontent.com/lukes/ISO-3166-Countries-with-Regional-Codes/master/all/all.csv"
-)
-tracks = pd.read_json(os.path.join(script_dir, "seed-data", "tracks.json"))
-territories = tracks.isrcTerritory.drop_duplicates()
-
-country_info_for_territories = pd.merge(
-    full_country_info,
-    territories,
-    left_on="name",
-    right_on="isrcTerritory",
-    how="right",
-)
-country_info_for_territories[country_info_for_territories.name.isna()]
-
-renames_country_info = {
-    "United States of America": "United States",
-    "United Kingdom of Great Britain and Northern Ireland": "United Kingdom",
-    "Czechia": "Czech Republic",
-    "Taiwan, Province of China": "Taiwan",
-    "Korea, Republic of": "South Korea",
+# build all tables (only the stages whose inputs changed are actually re-computed) and write each of them once
+seed_table_builders = {
+    "tracks": get_seed_tracks,
+    "track_artists": get_seed_track_artists,
+    "top50_global": get_seed_global_chart_entries,
+    "top50_countries": get_seed_country_chart_entries,
+    "countries": get_seed_countries,
+    "isrc_agencies": get_seed_isrc_agencies,
+    "album_artists": get_seed_album_artists,
+    "albums": get_seed_albums,
+    "artists": get_seed_artists,
 }
-full_country_info_fixed = full_country_info.replace({"name": renames_country_info})
-
-renames_isrc_territory = {
-    "Chinese Taipei": "Taiwan",
-    "Hong Kong SAR, China": "Hong Kong",
+seed_tables = {
+    name: store_and_print_info(build(), name)
+    for name, build in seed_table_builders.items()
 }
-territories = territories.replace(renames_isrc_territory)
-
-country_info_for_territories_fixed = pd.merge(
-    full_country_info_fixed,
-    territories,
-    left_on="name",
-    right_on="isrcTerritory",
-    how="right",
-)
-country_info_for_territories_fixed = pd.concat(
-    [
-        country_info_for_territories_fixed,
-        pd.DataFrame(
-            [
-                {
-                    "name": "Kosovo",
-                    "alpha-2": "XK",
-                    "alpha-3": "XKX",
-                    "region": "Europe",
-                    "sub-region": "Eastern Europe",
-                }
-            ]
-        ),
-    ]
-)
-
-country_info_for_territories_fixed.rename(
-    columns={
-        "alpha-2": "isoAlpha2",
-        "alpha-3": "isoAlpha3",
-        "region": "geoRegion",
-        "sub-region": "geoSubregion",
-    },
-    inplace=True,
-)
-countries = pd.read_json(os.path.join(script_dir, "seed-data", "countries.json"))
-
-countries_complete = pd.concat(
-    [countries, country_info_for_territories_fixed[countries.columns]]
-).drop_duplicates()
-countries_complete = countries_complete[~countries_complete.name.isna()]
-store_and_print_info(countries_complete, "countries")
 
 # %%
-# map categorical track features encoded with boolean/numbers to human-readable strings
-tracks = pd.read_json(os.path.join(script_dir, "seed-data", "tracks.json"))
-
-tracks["mode"] = tracks["mode"].astype("category")
-tracks["mode"] = tracks["mode"].cat.rename_categories({0: "Minor", 1: "Major"})
-
-
-def rename_least_frequent_to_other(series, share_of_total=0.01):
-    """Rename least frequent values to 'Other'."""
-    counts = series.value_counts()
-    least_frequent = counts[counts < share_of_total * counts.sum()]
-    return series.replace(least_frequent.index, "Other")
-
-
-tracks["timeSignature"] = rename_least_frequent_to_other(tracks.timeSignature)
-tracks["timeSignature"] = tracks["timeSignature"].astype("category")
-tracks["timeSignature"] = tracks["timeSignature"].cat.rename_categories(
-    {3: "3/4", 4: "4/4", 5: "5/4"}
-)
-tracks["explicit"] = tracks["explicit"].astype("category")
-tracks["explicit"] = tracks["explicit"].cat.rename_categories({0: "No", 1: "Yes"})
-tracks["key"] = tracks["key"].astype("category")
-tracks["key"] = tracks["key"].cat.rename_categories(
-    {
-        0: "C",
-        1: "C#/Db",
-        2: "D",
-        3: "D#/Eb",
-        4: "E",
-        5: "F",
-        6: "F#/Gb",
-        7: "G",
-        8: "G#/Ab",
-        9: "A",
-        10: "A#/Bb",
-        11: "B",
-    }
-)
-store_and_print_info(tracks, "tracks")
-# %%
-isrc_agency_data = tracks[["isrcAgency", "isrcTerritory"]].drop_duplicates()
-isrc_agency_data["isrcTerritory"] = isrc_agency_data.isrcTerritory.replace(
-    renames_isrc_territory
-)
-
-store_and_print_info(isrc_agency_data, "isrc_agencies")
+# write everything straight into the database (much faster than running seed.ts, see bulk_load.py)
+# DATABASE_URL can point to the MySQL database from schema.prisma or a local SQLite file (e.g. file:./db.sqlite)
+# the stream sums are only loaded this way (seed.ts doesn't use them), so they aren't written to a JSON file
+if os.getenv("DATABASE_URL"):
+    load_seed_data(
+        {**seed_tables, "stream_sums": get_seed_stream_sums()},
+        os.environ["DATABASE_URL"],
+    )
+else:
+    print("DATABASE_URL not set, run seed.ts or bulk_load.py to load the data")
 
 # %%
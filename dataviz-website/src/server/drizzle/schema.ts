@@ -51,6 +51,27 @@ export const artist = mysqlTable("Artist", {
   thumbnailUrl: varchar("thumbnailUrl", { length: 191 }),
 });
 
+export const chartStreamSum = mysqlTable(
+  "ChartStreamSum",
+  {
+    region: varchar("region", { length: 191 }).notNull(),
+    trackId: varchar("trackId", { length: 191 }).notNull(),
+    date: datetime("date", { mode: "string", fsp: 3 }).notNull(),
+    cumStreams: double("cumStreams").notNull(),
+    cumDays: int("cumDays").notNull(),
+  },
+  (table) => {
+    return {
+      trackIdIdx: index("ChartStreamSum_trackId_idx").on(table.trackId),
+      chartStreamSumRegionTrackIdDate: primaryKey(
+        table.region,
+        table.trackId,
+        table.date
+      ),
+    };
+  }
+);
+
 export const country = mysqlTable("Country", {
   name: varchar("name", { length: 191 }).primaryKey().notNull(),
   isoAlpha3: varchar("isoAlpha3", { length: 191 }).notNull(),